@@ -1,12 +1,27 @@
-import asyncio
 import os
 import logging
+import time
+from stat import S_ISREG
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request, Body
-from fastapi.responses import StreamingResponse, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydub import AudioSegment
 import httpx
 from dotenv import load_dotenv
+from chunk_cache import ChunkCache, cache_key, content_key
+from chunk_sessions import SessionRegistry
+from assets import load_assets
+from audio_stream import stream_chunks
+from chunk_policy import ChunkPolicy
+from workers import WorkerPool
+from pacing import PacingScheduler
+from http_pool import get_httpx_client, close_http_clients
+from metrics import REGISTRY, Counter, Gauge, SampledLogger, stage
+from chunk_server import serve_bytes, serve_file
+from chunk_store import ChunkStore
+from submitter import ordered_pipeline, post_with_retries
+from synth_pool import RAW_PCM_FORMATS, SynthesizerPool, synthesizer_factory
+from tts_pipeline import script_digest, tts_chunks
 
 # Load environment variables from .env file
 load_dotenv()
@@ -14,7 +29,25 @@ load_dotenv()
 # Access the DID API key from environment variables
 DID_KEY = os.getenv('DID_API_KEY')
 
-app = FastAPI()
+# D-ID API base URL, and the base URL D-ID fetches chunks from (default: https://<request host>).
+# Both can point at local services, e.g. bench.py's D-ID stand-in.
+DID_API_URL = os.getenv("DID_API_URL", "https://api.d-id.com")
+CHUNK_BASE_URL = os.getenv("CHUNK_BASE_URL")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global encode_pool
+    encode_pool = WorkerPool(ENCODE_WORKERS, ENCODE_QUEUE_DEPTH, timings=stage("encode"))
+    chunk_sessions.start()
+    yield
+    await chunk_cache.close()
+    await chunk_sessions.stop()
+    encode_pool.shutdown()
+    if synthesizer_pool is not None:
+        synthesizer_pool.shutdown()
+    await close_http_clients()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS configuration
 app.add_middleware(
@@ -30,65 +63,248 @@ CHUNK_DIR = "audio_chunks"
 if not os.path.exists(CHUNK_DIR):
     os.makedirs(CHUNK_DIR)
 
+# Source audio and chunking parameters: chunks start at CHUNK_FIRST_MS for a fast start and grow by
+# CHUNK_GROWTH up to CHUNK_SIZE_MS, each cut at the quietest point within CHUNK_SEARCH_MS of its target
+# size (overridable per request with "chunk_policy")
+SOURCE_FILE = "audio.mp3"
+CHUNK_SIZE_MS = int(os.getenv("CHUNK_SIZE_MS", 5000))
+CHUNK_FIRST_MS = int(os.getenv("CHUNK_FIRST_MS", 1000))
+CHUNK_GROWTH = float(os.getenv("CHUNK_GROWTH", 2.0))
+CHUNK_SEARCH_MS = int(os.getenv("CHUNK_SEARCH_MS", 400))
+DEFAULT_CHUNK_POLICY = ChunkPolicy(CHUNK_FIRST_MS, CHUNK_SIZE_MS, CHUNK_GROWTH, CHUNK_SEARCH_MS)
+CHUNK_FORMAT = "mp3"
+CHUNK_MEDIA_TYPE = "audio/mpeg"
+
+# PCM format the source is decoded to before encoding chunks
+STREAM_SAMPLE_RATE = int(os.getenv("STREAM_SAMPLE_RATE", 22050))
+STREAM_CHANNELS = int(os.getenv("STREAM_CHANNELS", 1))
+
+# Process pool for chunk encoding: worker count, jobs submitted at once across all sessions,
+# and chunks each stream may have waiting on the pool before its decode pauses
+ENCODE_WORKERS = int(os.getenv("ENCODE_WORKERS", os.cpu_count() or 1))
+ENCODE_QUEUE_DEPTH = int(os.getenv("ENCODE_QUEUE_DEPTH", 2 * ENCODE_WORKERS))
+ENCODE_AHEAD = int(os.getenv("ENCODE_AHEAD", 2))
+
+# Seconds before the previous chunk ends that the next one is sent (overridable per request with "lead_time")
+PACING_LEAD_TIME = float(os.getenv("PACING_LEAD_TIME", 1.0))
+
+# Chunk POSTs to D-ID that may be awaiting a response at once, and retries for each
+SUBMIT_MAX_IN_FLIGHT = int(os.getenv("SUBMIT_MAX_IN_FLIGHT", 3))
+SUBMIT_RETRIES = int(os.getenv("SUBMIT_RETRIES", 3))
+SUBMIT_BACKOFF = float(os.getenv("SUBMIT_BACKOFF", 0.25))
+
+# Size cap for encoded chunks kept in CHUNK_DIR
+CHUNK_CACHE_MAX_BYTES = int(os.getenv("CHUNK_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Byte budget for keeping encoded chunks in memory instead of on disk; 0 keeps everything on disk
+CHUNK_MEMORY_BYTES = int(os.getenv("CHUNK_MEMORY_BYTES", 0))
+
+# Per-session chunk namespaces: removed this many seconds after a stream finishes,
+# or after this long without activity if it never does
+SESSION_DIR = os.path.join(CHUNK_DIR, ".sessions")
+SESSION_LINGER = int(os.getenv("SESSION_LINGER", 120))
+SESSION_IDLE_TIMEOUT = int(os.getenv("SESSION_IDLE_TIMEOUT", 600))
+
+# Text-to-speech for scripts sent to /stream-audio as "text": Azure (or SPEECH_BACKEND=fake) synthesizers,
+# and how many sentences of one script are synthesized at once
+SPEECH_KEY = os.getenv("SPEECH_KEY")
+SPEECH_REGION = os.getenv("SPEECH_REGION")
+SPEECH_VOICE = os.getenv("SPEECH_VOICE", "")
+SPEECH_BACKEND = os.getenv("SPEECH_BACKEND", "azure")
+SYNTHESIZER_POOL_SIZE = int(os.getenv("SYNTHESIZER_POOL_SIZE", 4))
+TTS_PARALLEL_SENTENCES = int(os.getenv("TTS_PARALLEL_SENTENCES", SYNTHESIZER_POOL_SIZE))
+
+# Log level (DEBUG, INFO, WARNING, ...). Per-chunk events are logged only for a sample of chunks,
+# see LOG_SAMPLE_RATE in metrics.py.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
 # Set up logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+# httpx logs every request at INFO, i.e. every chunk POST; keep only its warnings and errors
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("httpcore").setLevel(logging.WARNING)
+log = SampledLogger("app")
+
+# Encoded chunks held in memory, if enabled
+chunk_store = ChunkStore(CHUNK_MEMORY_BYTES) if CHUNK_MEMORY_BYTES > 0 else None
+
+# Encoded chunk sets shared across sessions
+chunk_cache = ChunkCache(CHUNK_DIR, max_bytes=CHUNK_CACHE_MAX_BYTES, store=chunk_store)
+
+# Assets prepared offline with `python convert.py --prepare -f mp3 -o audio_chunks`, loaded once at startup.
+# Chunks are served as CHUNK_MEDIA_TYPE, so assets in any other format are left out.
+assets = load_assets(CHUNK_DIR)
+for asset_id, asset in list(assets.items()):
+    if asset.format != CHUNK_FORMAT:
+        logging.warning(f"Asset {asset_id} is {asset.format}, not {CHUNK_FORMAT}; skipping it")
+        del assets[asset_id]
 
-# Load audio file (using a static file for testing)
-def load_audio(file_path):
-    return AudioSegment.from_file(file_path)
+# Chunk namespaces of the streams currently being served
+chunk_sessions = SessionRegistry(
+    SESSION_DIR, store=chunk_store, idle_timeout=SESSION_IDLE_TIMEOUT, linger=SESSION_LINGER
+)
+
+# Created at startup so worker processes are not forked at import time
+encode_pool = None
+
+# Created on the first text request, so deployments that only stream files need no speech credentials
+synthesizer_pool = None
 
-# Generate audio chunks
-def generate_chunks(audio, chunk_size=5000):
-    return [audio[i:i+chunk_size] for i in range(0, len(audio), chunk_size)]
+# Rate speech is synthesized at: STREAM_SAMPLE_RATE when the service offers it, otherwise 24 kHz resampled
+SYNTHESIS_SAMPLE_RATE = STREAM_SAMPLE_RATE if STREAM_SAMPLE_RATE in RAW_PCM_FORMATS else 24000
+
+# Metrics served on /metrics, next to the per-stage timings in metrics.STAGE_SECONDS
+DID_POSTS = Counter("avatar_did_posts_total", "Chunk POSTs to D-ID by outcome", ["result"])
+DID_POSTS_IN_FLIGHT = Gauge("avatar_did_posts_in_flight", "Chunk POSTs to D-ID awaiting a response")
+CHUNK_FETCHES = Counter("avatar_chunk_fetches_total", "Chunk requests by where the chunk was served from", ["source"])
+ACTIVE_STREAMS = Gauge("avatar_active_streams", "/stream-audio responses in progress")
+SESSIONS = Gauge("avatar_chunk_sessions", "Chunk namespaces held open, including lingering ones")
+SESSIONS.set_function(lambda: len(chunk_sessions.sessions))
+ENCODE_QUEUE = Gauge("avatar_encode_queue", "Encode jobs running in the pool or waiting for a slot", ["state"])
+ENCODE_QUEUE.labels(state="in_flight").set_function(lambda: encode_pool.submitted if encode_pool else None)
+ENCODE_QUEUE.labels(state="waiting").set_function(lambda: encode_pool.waiting if encode_pool else None)
+CACHE_HIT_RATIO = Gauge("avatar_cache_hit_ratio", "Share of lookups served without a build", ["cache"])
+CACHE_HIT_RATIO.labels(cache="chunks").set_function(
+    lambda: chunk_cache.hits / (chunk_cache.hits + chunk_cache.misses) if chunk_cache.hits + chunk_cache.misses else None
+)
+CACHE_BYTES = Gauge("avatar_cache_bytes", "Bytes held by the chunk cache", ["tier"])
+CACHE_BYTES.labels(tier="disk").set_function(lambda: chunk_cache.total_bytes)
+CACHE_BUILDS = Gauge("avatar_cache_builds", "Chunk sets being decoded or synthesized")
+CACHE_BUILDS.set_function(lambda: len(chunk_cache._building))
+if chunk_store is not None:
+    CACHE_HIT_RATIO.labels(cache="memory").set_function(
+        lambda: chunk_store.hits / (chunk_store.hits + chunk_store.misses) if chunk_store.hits + chunk_store.misses else None
+    )
+    CACHE_BYTES.labels(tier="memory").set_function(lambda: chunk_store.total_bytes)
+SYNTHESIZERS_IDLE = Gauge("avatar_synthesizers_idle", "Speech synthesizers free to take a sentence")
+SYNTHESIZERS_IDLE.set_function(lambda: synthesizer_pool.stats()["idle"] if synthesizer_pool else None)
 
-# Save chunk to local file
-def save_chunk_to_local(chunk, filename):
-    file_path = os.path.join(CHUNK_DIR, filename)
-    chunk.export(file_path, format="mp3")
-    return file_path
+def get_synthesizer_pool():
+    global synthesizer_pool
+    if synthesizer_pool is None:
+        factory = synthesizer_factory(
+            SPEECH_KEY, SPEECH_REGION, SPEECH_VOICE, backend=SPEECH_BACKEND, pcm_sample_rate=SYNTHESIS_SAMPLE_RATE,
+        )
+        synthesizer_pool = SynthesizerPool(factory, SYNTHESIZER_POOL_SIZE)
+    return synthesizer_pool
+
+# Decode the source incrementally and encode each chunk into dest_dir as soon as it is complete.
+# ffmpeg decodes in its own process and encoding runs on encode_pool, so the event loop only moves bytes.
+def build_chunks(source_path, policy, dest_dir):
+    return stream_chunks(
+        source_path, dest_dir, policy, STREAM_SAMPLE_RATE, STREAM_CHANNELS, CHUNK_FORMAT,
+        pool=encode_pool, ahead=ENCODE_AHEAD, in_memory=chunk_store is not None,
+    )
+
+# Synthesize a script sentence by sentence, several sentences at once, and encode each sentence's
+# audio into chunks as soon as it and the sentences before it are done
+def build_tts_chunks(script, policy, dest_dir):
+    return tts_chunks(
+        get_synthesizer_pool(), script, dest_dir, policy, STREAM_SAMPLE_RATE, STREAM_CHANNELS, CHUNK_FORMAT,
+        parallel=TTS_PARALLEL_SENTENCES, encode_pool=encode_pool, ahead=ENCODE_AHEAD,
+        in_memory=chunk_store is not None, source_rate=SYNTHESIS_SAMPLE_RATE,
+    )
 
 # Streaming endpoint
 @app.post("/stream-audio")
 async def stream_audio(request: Request, body: dict = Body(...)):
     stream_id = body.get("stream_id")
     session_id = body.get("session_id")
+    lead_time = body.get("lead_time", PACING_LEAD_TIME)
+    # Optional script to speak, or prepared asset to stream, instead of SOURCE_FILE
+    text = body.get("text")
+    asset_id = body.get("asset_id")
 
     if not stream_id or not session_id:
         raise HTTPException(status_code=400, detail="stream_id and session_id are required in the request body.")
+    if text is not None and (not isinstance(text, str) or not text.strip()):
+        raise HTTPException(status_code=400, detail="text must be a non-empty string.")
+    if text is not None and asset_id is not None:
+        raise HTTPException(status_code=400, detail="Send either text or asset_id, not both.")
+    asset = None
+    if asset_id is not None:
+        asset = assets.get(asset_id) if isinstance(asset_id, str) else None
+        if asset is None:
+            raise HTTPException(status_code=404, detail=f"Unknown asset_id: {asset_id}")
+    if not isinstance(lead_time, (int, float)) or lead_time < 0:
+        raise HTTPException(status_code=400, detail="lead_time must be a non-negative number of seconds.")
+    policy = DEFAULT_CHUNK_POLICY
+    if body.get("chunk_policy") is not None:
+        if not isinstance(body["chunk_policy"], dict):
+            raise HTTPException(status_code=400, detail="chunk_policy must be an object.")
+        try:
+            policy = ChunkPolicy.from_dict(body["chunk_policy"], DEFAULT_CHUNK_POLICY)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
     async def generate():
-        # Load and chunk audio
-        audio = load_audio("audio.mp3")
-        chunks = generate_chunks(audio)
+        started = time.perf_counter()
+        # Reuse the encoded chunks for this source (or script), decoding and encoding only on a cache miss.
+        # Chunks arrive as soon as they are encoded, so sending starts before the decode (or synthesis) finishes.
+        params = dict(
+            chunk_policy=policy.describe(), format=CHUNK_FORMAT, sample_rate=STREAM_SAMPLE_RATE, channels=STREAM_CHANNELS,
+        )
+        if asset is not None:
+            # Every chunk is already on disk and listed in the asset index: nothing to decode or wait for
+            chunks = asset.chunks()
+        elif text is not None:
+            key = content_key(script_digest(text, SPEECH_VOICE, SPEECH_BACKEND), **params)
+            chunks = chunk_cache.chunks(key, lambda dest_dir: build_tts_chunks(text, policy, dest_dir))
+        else:
+            key = cache_key(SOURCE_FILE, **params)
+            chunks = chunk_cache.chunks(
+                key, lambda dest_dir: build_chunks(SOURCE_FILE, policy, dest_dir)
+            )
+
+        # Give this stream its own chunk namespace
+        session = chunk_sessions.open(stream_id)
+        pacer = PacingScheduler(lead_time=lead_time)
 
         # Use host URL to generate chunk URLs
-        host_url = f"https://{request.url.hostname}"
-
-        async with httpx.AsyncClient() as client:
-            for i, chunk in enumerate(chunks):
-                filename = f"chunk_{i}.mp3"
-                save_chunk_to_local(chunk, filename)
-                chunk_url = f"{host_url}/get-chunk/{filename}"
-                logging.debug(f"Generated chunk URL: {chunk_url}")
-
-                # Add delay 10 seconds between chunks
-                await asyncio.sleep(10)
-
-                # Request body with session_id
-                request_body = {
-                    "script": {
-                        "type": "audio",
-                        "audio_url": chunk_url
-                    },
-                    "config": {
-                        "stitch": True
-                    },
-                    "session_id": session_id,
-                }
+        host_url = CHUNK_BASE_URL or f"https://{request.url.hostname}"
 
-                # Send the chunk URL to D-ID API with Basic Auth
-                response = await client.post(
-                    f"https://api.d-id.com/talks/streams/{stream_id}",  # Use stream_id from the body
+        # Keep-alive connection pool shared by every session in this process
+        client = get_httpx_client()
+
+        # Link each chunk as it arrives and start its POST when the pacer says so,
+        # without waiting for earlier POSTs to come back
+        async def jobs():
+            first = True
+            async for chunk in chunks:
+                if first:
+                    stage("first_chunk").observe(time.perf_counter() - started)
+                    first = False
+                # Link before the cache can move or evict it
+                filename = chunk_sessions.link(session, chunk)
+                chunk_url = f"{host_url}/get-chunk/{session.namespace}/{filename}"
+                log.event("chunk_linked", level=logging.DEBUG, stream=stream_id, url=chunk_url, duration=f"{chunk.duration:.3f}")
+
+                # Send while the previous chunk is still playing, based on its duration and the POST latency
+                await pacer.wait_turn(chunk.duration)
+                yield send_chunk(filename, chunk_url)
+
+        async def send_chunk(filename, chunk_url):
+            # Request body with session_id
+            request_body = {
+                "script": {
+                    "type": "audio",
+                    "audio_url": chunk_url
+                },
+                "config": {
+                    "stitch": True
+                },
+                "session_id": session_id,
+            }
+
+            # Send the chunk URL to D-ID API with Basic Auth, retrying transient failures
+            posted = time.perf_counter()
+            DID_POSTS_IN_FLIGHT.inc()
+            try:
+                response = await post_with_retries(
+                    client,
+                    f"{DID_API_URL}/talks/streams/{stream_id}",  # Use stream_id from the body
+                    retries=SUBMIT_RETRIES,
+                    backoff=SUBMIT_BACKOFF,
                     headers={
                         "Authorization": f"Basic {DID_KEY}",
                         "accept": "application/json",
@@ -96,29 +312,106 @@ async def stream_audio(request: Request, body: dict = Body(...)):
                     },
                     json=request_body
                 )
+            except httpx.HTTPError as e:
+                DID_POSTS.labels(result="error").inc()
+                logging.error(f"Failed to send chunk to D-ID API: {e!r}")
+                chunk_sessions.acknowledged(session, filename, accepted=False)
+                return f"data: failure\n{chunk_url}\n\n"
+            finally:
+                DID_POSTS_IN_FLIGHT.dec()
+            stage("did_post").observe(time.perf_counter() - posted)
+
+            pacer.record_rtt(response.elapsed.total_seconds())
+            chunk_sessions.acknowledged(session, filename, accepted=response.status_code == 200)
 
-                if response.status_code == 200:
-                    logging.info(f"Chunk sent successfully to D-ID API: {chunk_url}")
-                    yield f"data: success\n{chunk_url}\n\n"
-                else:
-                    logging.error(f"Failed to send chunk to D-ID API: {response.text}")
-                    yield f"data: failure\n{chunk_url}\n\n"
+            if response.status_code == 200:
+                DID_POSTS.labels(result="success").inc()
+                log.event("chunk_sent", stream=stream_id, url=chunk_url, rtt=f"{response.elapsed.total_seconds():.3f}")
+                return f"data: success\n{chunk_url}\n\n"
+            else:
+                DID_POSTS.labels(result="rejected").inc()
+                logging.error(f"Failed to send chunk to D-ID API: {response.text}")
+                return f"data: failure\n{chunk_url}\n\n"
+
+        # Results are reported in chunk order even when POSTs complete out of order
+        pipeline = ordered_pipeline(jobs(), SUBMIT_MAX_IN_FLIGHT)
+        ACTIVE_STREAMS.inc()
+        try:
+            async for event in pipeline:
+                yield event
+        finally:
+            ACTIVE_STREAMS.dec()
+            try:
+                # Closing the pipeline cancels and joins its feeder, so nothing is still iterating
+                # `chunks` when it is closed (e.g. after a client disconnect)
+                await pipeline.aclose()
+                await chunks.aclose()
+            finally:
+                chunk_sessions.finish(session)
 
     return StreamingResponse(generate(), media_type='text/event-stream')
 
-# Endpoint to access chunk audio allowing all HTTP methods
-@app.api_route("/get-chunk/{filename}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS", "HEAD"])
-async def get_chunk(request: Request, filename: str):
-    file_path = os.path.join(CHUNK_DIR, filename)
-    if os.path.exists(file_path):
-        if request.method == "HEAD":
-            return Response(status_code=200)  # Respond with 200 OK for HEAD request
-        logging.debug(f"Serving file: {file_path}")
-        return StreamingResponse(open(file_path, "rb"), media_type="audio/mp3")
+# Endpoint to access chunk audio allowing all HTTP methods.
+# Answers HEAD with the real size, honours Range and If-None-Match, and never leaves a file handle open.
+@app.api_route("/get-chunk/{namespace}/{filename}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS", "HEAD"])
+async def get_chunk(request: Request, namespace: str, filename: str):
+    # Time to resolve the chunk and start the response; the body is sent after this returns
+    with stage("chunk_fetch").time():
+        return _get_chunk(request, namespace, filename)
+
+def _get_chunk(request, namespace, filename):
+    if os.path.basename(namespace) != namespace or os.path.basename(filename) != filename:
+        raise HTTPException(status_code=404, detail="File not found")
+    # Session namespaces first, then content-addressed cache entries
+    session = chunk_sessions.get(namespace)
+    if session is not None:
+        file_path, store_key = chunk_sessions.resolve(namespace, filename)
     else:
-        logging.error(f"File not found: {file_path}")
+        chunk = chunk_cache.lookup(namespace, filename)
+        file_path, store_key = (chunk.path, chunk.store_key) if chunk else (None, None)
+        if chunk is None:
+            # A session opened by another worker sharing CHUNK_DIR
+            file_path = chunk_sessions.find(namespace, filename)
+
+    # Chunks held in memory never touch the disk
+    stored = chunk_store.get(store_key) if store_key is not None else None
+    if stored is not None:
+        if session is not None and request.method != "HEAD":
+            chunk_sessions.fetched(session, filename)
+        CHUNK_FETCHES.labels(source="memory").inc()
+        return serve_bytes(request, stored.data, stored.etag, CHUNK_MEDIA_TYPE)
+
+    try:
+        stat = os.stat(file_path) if file_path else None
+    except OSError:
+        stat = None
+    if stat is None or not S_ISREG(stat.st_mode):
+        CHUNK_FETCHES.labels(source="missing").inc()
+        logging.error(f"Chunk not found: {namespace}/{filename}")
         raise HTTPException(status_code=404, detail="File not found")
 
+    CHUNK_FETCHES.labels(source="disk").inc()
+    log.event("chunk_served", level=logging.DEBUG, method=request.method, path=file_path, bytes=stat.st_size)
+    return serve_file(request, file_path, CHUNK_MEDIA_TYPE, stat)
+
+# Chunk cache usage
+@app.get("/cache-stats")
+async def cache_stats():
+    stats = {**chunk_cache.stats(), "sessions": chunk_sessions.stats()}
+    if chunk_store is not None:
+        stats["memory"] = chunk_store.stats()
+    return stats
+
+# Encode pool utilization, for sizing ENCODE_WORKERS
+@app.get("/pool-stats")
+async def pool_stats():
+    return encode_pool.stats()
+
+# Prometheus scrape endpoint: per-stage latency histograms, POST outcomes, queue depths and cache hit rates
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="localhost", port=8000, log_level="debug")
+    uvicorn.run(app, host="localhost", port=8000, log_level=LOG_LEVEL.lower())
@@ -0,0 +1,80 @@
+import json
+import logging
+import os
+from chunk_cache import ChunkRef
+
+# Prepared assets live under <chunk dir>/.assets/<asset id>/, outside the evictable chunk cache,
+# and are listed in <chunk dir>/.assets/assets.json
+ASSET_DIR = ".assets"
+ASSET_INDEX = "assets.json"
+
+
+# A chunk set prepared offline (python convert.py --prepare): every chunk's file, duration,
+# size and hash is known before a stream starts, so nothing is decoded at request time
+class Asset:
+    def __init__(self, asset_id, path, files, durations, sizes, hashes, format, sample_rate, channels):
+        self.asset_id = asset_id
+        self.path = path
+        self.files = files
+        self.durations = durations
+        self.sizes = sizes
+        self.hashes = hashes
+        self.format = format
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+    @property
+    def duration(self):
+        return sum(self.durations)
+
+    # ChunkRefs for SessionRegistry.link, in order
+    async def chunks(self):
+        for filename, duration in zip(self.files, self.durations):
+            yield ChunkRef(filename, duration, os.path.join(self.path, filename), None)
+
+    def to_dict(self):
+        return {
+            "files": self.files,
+            "durations": self.durations,
+            "sizes": self.sizes,
+            "hashes": self.hashes,
+            "format": self.format,
+            "sample_rate": self.sample_rate,
+            "channels": self.channels,
+        }
+
+
+def asset_root(chunk_dir):
+    return os.path.join(chunk_dir, ASSET_DIR)
+
+
+# Read the asset index once; assets whose files are missing are left out
+def load_assets(chunk_dir):
+    root = asset_root(chunk_dir)
+    try:
+        with open(os.path.join(root, ASSET_INDEX)) as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.error(f"Could not read the asset index in {root}: {e}")
+        return {}
+    assets = {}
+    for asset_id, entry in index.items():
+        path = os.path.join(root, asset_id)
+        if not all(os.path.exists(os.path.join(path, filename)) for filename in entry["files"]):
+            logging.warning(f"Asset {asset_id} is incomplete on disk, skipping it")
+            continue
+        assets[asset_id] = Asset(asset_id, path, **entry)
+    if assets:
+        logging.info(f"Loaded {len(assets)} prepared assets from {root}")
+    return assets
+
+
+def save_assets(chunk_dir, assets):
+    root = asset_root(chunk_dir)
+    os.makedirs(root, exist_ok=True)
+    tmp_path = os.path.join(root, f"{ASSET_INDEX}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({asset_id: asset.to_dict() for asset_id, asset in sorted(assets.items())}, f, separators=(",", ":"))
+    os.replace(tmp_path, os.path.join(root, ASSET_INDEX))
@@ -0,0 +1,105 @@
+import asyncio
+import os
+from collections import deque
+import time
+from chunk_policy import policy_chunks
+from metrics import stage
+from pcm import SAMPLE_WIDTH, as_frames, encode
+
+# Size of the reads from ffmpeg that feed the chunker
+DECODE_BLOCK_MS = 250
+
+
+# Decode a source file with ffmpeg and yield raw PCM blocks of block_bytes each (the last may be shorter).
+# Only the block being filled is held in memory; ffmpeg is paused by the pipe while we are busy.
+async def decode_pcm(source_path, sample_rate, channels, block_bytes):
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-nostdin", "-loglevel", "error",
+        "-i", source_path,
+        "-f", "s16le", "-acodec", "pcm_s16le",
+        "-ac", str(channels), "-ar", str(sample_rate),
+        "pipe:1",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    decode_time = stage("decode")
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                block = await proc.stdout.readexactly(block_bytes)
+            except asyncio.IncompleteReadError as e:
+                if e.partial:
+                    decode_time.observe(time.perf_counter() - start)
+                    yield e.partial
+                break
+            decode_time.observe(time.perf_counter() - start)
+            yield block
+
+        stderr = await proc.stderr.read()
+        if await proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to decode {source_path}: {stderr.decode(errors='replace').strip()}")
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+
+
+# Encode one block of PCM (bytes or a (frames, channels) array view) to file_path
+def encode_pcm(pcm, sample_rate, channels, file_path, format="mp3"):
+    return encode(as_frames(pcm, channels), sample_rate, format, path=file_path)
+
+
+# Encode one block of PCM and return the encoded bytes
+def encode_pcm_bytes(pcm, sample_rate, channels, format="mp3"):
+    return encode(as_frames(pcm, channels), sample_rate, format)
+
+
+# Decode source_path incrementally and encode each chunk into dest_dir as soon as its samples arrive.
+# Chunk sizes and cut points follow `policy` (a chunk_policy.ChunkPolicy).
+# See encode_chunks for the pool, `ahead` and in_memory behaviour.
+def stream_chunks(source_path, dest_dir, policy, sample_rate, channels, format="mp3", pool=None, ahead=2,
+                  in_memory=False):
+    block_bytes = sample_rate * DECODE_BLOCK_MS // 1000 * SAMPLE_WIDTH * channels
+    blocks = policy_chunks(decode_pcm(source_path, sample_rate, channels, block_bytes), policy, sample_rate, channels)
+    return encode_chunks(
+        blocks, dest_dir, sample_rate, channels, format, pool=pool, ahead=ahead, in_memory=in_memory,
+    )
+
+
+# Encode each block of PCM from `blocks` (an async iterable) into its own chunk in dest_dir.
+# With a worker pool, up to `ahead` chunks are encoded in parallel while blocks keep coming;
+# without one, encoding runs inline. Yields (filename, duration in seconds) in order, or with
+# in_memory, (filename, duration, encoded bytes) without writing anything to dest_dir.
+async def encode_chunks(blocks, dest_dir, sample_rate, channels, format="mp3", pool=None, ahead=2, in_memory=False):
+    pending = deque()
+    try:
+        i = 0
+        async for pcm in blocks:
+            filename = f"chunk_{i}.{format}"
+            file_path = os.path.join(dest_dir, filename)
+            chunk = (filename, len(as_frames(pcm, channels)) / sample_rate)
+            if in_memory:
+                encode, args = encode_pcm_bytes, (pcm, sample_rate, channels, format)
+            else:
+                encode, args = encode_pcm, (pcm, sample_rate, channels, file_path, format)
+            if pool is None:
+                with stage("encode").time():
+                    result = encode(*args)
+                yield (*chunk, result) if in_memory else chunk
+            else:
+                pending.append((chunk, asyncio.ensure_future(pool.run(encode, *args))))
+                # Hand the first chunk out as soon as it is encoded, then pause the source
+                # once `ahead` chunks are waiting on the pool
+                if i == 0 or len(pending) >= ahead:
+                    chunk, job = pending.popleft()
+                    result = await job
+                    yield (*chunk, result) if in_memory else chunk
+            i += 1
+        while pending:
+            chunk, job = pending.popleft()
+            result = await job
+            yield (*chunk, result) if in_memory else chunk
+    finally:
+        for _, job in pending:
+            job.cancel()
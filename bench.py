@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+import aiohttp
+from aiohttp import web
+
+# Load test for app.py: runs the app in a subprocess against a local stand-in for D-ID's
+# /talks/streams API, drives concurrent /stream-audio sessions, and reports latency and resource use.
+#
+#   python bench.py --sessions 20 --did-latency 0.15 --did-error-rate 0.05
+#   python bench.py --sessions 10 --text "Hello there. How are you today?"   (uses SPEECH_BACKEND=fake)
+#   python bench.py --sessions 50 --asset-id intro --json results.json
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def summarize(values, scale=1000.0):
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 0.5) * scale, 2),
+        "p95": round(percentile(values, 0.95) * scale, 2),
+        "p99": round(percentile(values, 0.99) * scale, 2),
+        "max": round(max(values) * scale, 2),
+    }
+
+
+# Stand-in for POST /talks/streams/{stream_id}: waits `latency` (± jitter), fails with a 500 at
+# `error_rate`, and otherwise checks audio_url with a HEAD and downloads it the way D-ID would
+# before answering 200
+class MockDid:
+    def __init__(self, latency=0.1, jitter=0.05, error_rate=0.0, fetch=True):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.fetch = fetch
+        self.posts = 0
+        self.errors = 0
+        self.fetch_failures = 0
+        self.fetch_times = []
+        # (stream_id, audio_url) -> time the first POST for it arrived
+        self.received = {}
+        self.session = None
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/talks/streams/{stream_id}", self.talk)
+        return app
+
+    async def talk(self, request):
+        arrived = time.monotonic()
+        body = await request.json()
+        audio_url = body["script"]["audio_url"]
+        self.received.setdefault((request.match_info["stream_id"], audio_url), arrived)
+        self.posts += 1
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"kind": "InternalServerError"}, status=500)
+        if self.fetch:
+            start = time.monotonic()
+            async with self.session.head(audio_url) as response:
+                if response.status != 200:
+                    self.fetch_failures += 1
+                    return web.json_response({"kind": "AudioFetchFailed"}, status=400)
+            async with self.session.get(audio_url) as response:
+                await response.read()
+                if response.status != 200:
+                    self.fetch_failures += 1
+                    return web.json_response({"kind": "AudioFetchFailed"}, status=400)
+            self.fetch_times.append(time.monotonic() - start)
+        return web.json_response({"status": "started", "session_id": body.get("session_id")})
+
+
+# pid and all of its live descendants (encoder workers, ffmpeg), from /proc/<pid>/task/*/children
+def process_tree(root):
+    pids = [root]
+    for pid in pids:
+        try:
+            tasks = os.listdir(f"/proc/{pid}/task")
+        except OSError:
+            continue
+        for task in tasks:
+            try:
+                with open(f"/proc/{pid}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+            except OSError:
+                pass
+    return pids
+
+
+# /proc based CPU seconds and peak RSS (bytes) of a process and its children, or None where unavailable.
+# CPU includes children that have already exited and been waited for; peak RSS is the sum of each
+# live process' peak, so it is an upper bound.
+def process_usage(root):
+    cpu, peak = None, None
+    for pid in process_tree(root):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            # utime, stime, cutime, cstime
+            cpu = (cpu or 0) + sum(int(value) for value in fields[11:15]) / os.sysconf("SC_CLK_TCK")
+            with open(f"/proc/{pid}/status") as f:
+                hwm = next((int(line.split()[1]) * 1024 for line in f if line.startswith("VmHWM:")), None)
+            if hwm is not None:
+                peak = (peak or 0) + hwm
+        except (OSError, ValueError, IndexError):
+            continue
+    return cpu, peak
+
+
+async def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"app did not start listening on port {port}")
+
+
+# One /stream-audio session: time to its first chunk result and the arrival time of each result
+async def run_session(client, app_url, body, mock):
+    stream_id = f"strm_{uuid.uuid4().hex[:12]}"
+    payload = {"stream_id": stream_id, "session_id": f"sess_{uuid.uuid4().hex[:12]}", **body}
+    start = time.monotonic()
+    first = None
+    latencies, successes, failures = [], 0, 0
+    async with client.post(f"{app_url}/stream-audio", json=payload) as response:
+        if response.status != 200:
+            return {"error": f"HTTP {response.status}: {await response.text()}"}
+        buffer = b""
+        async for data in response.content.iter_any():
+            buffer += data
+            while b"\n\n" in buffer:
+                event, buffer = buffer.split(b"\n\n", 1)
+                lines = event.decode().splitlines()
+                if len(lines) < 2:
+                    continue
+                now = time.monotonic()
+                if first is None:
+                    first = now - start
+                if lines[0] == "data: success":
+                    successes += 1
+                else:
+                    failures += 1
+                # End to end: the app's first POST for the chunk reaching D-ID until its result reaches the client
+                sent = mock.received.get((stream_id, lines[1]))
+                if sent is not None:
+                    latencies.append(now - sent)
+    return {
+        "ttfc": first,
+        "duration": time.monotonic() - start,
+        "latencies": latencies,
+        "successes": successes,
+        "failures": failures,
+    }
+
+
+async def bench(args):
+    mock = MockDid(args.did_latency, args.did_jitter, args.did_error_rate, fetch=not args.no_fetch)
+    mock_port, app_port = free_port(), free_port()
+    runner = web.AppRunner(mock.app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", mock_port).start()
+
+    env = {
+        **os.environ,
+        "DID_API_URL": f"http://127.0.0.1:{mock_port}",
+        "CHUNK_BASE_URL": f"http://127.0.0.1:{app_port}",
+        "DID_API_KEY": os.getenv("DID_API_KEY", "bench"),
+        "SPEECH_BACKEND": os.getenv("SPEECH_BACKEND", "fake"),
+    }
+    app_proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(app_port),
+         "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL if args.quiet else None, stderr=subprocess.DEVNULL if args.quiet else None,
+    )
+    try:
+        await wait_for_port(app_port)
+        body = {"lead_time": args.lead_time}
+        if args.text:
+            body["text"] = args.text
+        if args.asset_id:
+            body["asset_id"] = args.asset_id
+        if args.chunk_policy:
+            body["chunk_policy"] = json.loads(args.chunk_policy)
+
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=args.timeout)
+        async with aiohttp.ClientSession(timeout=timeout) as client:
+            mock.session = client
+            # One warm-up session so the first measured one doesn't pay for building the chunk set;
+            # its cost is reported on its own
+            warmup = None
+            if args.warmup:
+                cpu_before, _ = process_usage(app_proc.pid)
+                start = time.monotonic()
+                await run_session(client, f"http://127.0.0.1:{app_port}", body, mock)
+                cpu_after, _ = process_usage(app_proc.pid)
+                warmup = {
+                    "elapsed_s": round(time.monotonic() - start, 2),
+                    "app_cpu_s": round(cpu_after - cpu_before, 4) if None not in (cpu_before, cpu_after) else None,
+                }
+            cpu_before, _ = process_usage(app_proc.pid)
+            gate = asyncio.Semaphore(args.concurrency or args.sessions)
+
+            async def one():
+                async with gate:
+                    return await run_session(client, f"http://127.0.0.1:{app_port}", body, mock)
+
+            start = time.monotonic()
+            results = await asyncio.gather(*(one() for _ in range(args.sessions)), return_exceptions=True)
+            elapsed = time.monotonic() - start
+            cpu_after, peak_rss = process_usage(app_proc.pid)
+    finally:
+        app_proc.terminate()
+        try:
+            app_proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            app_proc.kill()
+        await runner.cleanup()
+
+    errors = [str(r) if isinstance(r, Exception) else r["error"] for r in results
+              if isinstance(r, Exception) or "error" in r]
+    ok = [r for r in results if not isinstance(r, Exception) and "error" not in r]
+    cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    return {
+        "sessions": args.sessions,
+        "completed": len(ok),
+        "errors": errors[:10],
+        "elapsed_s": round(elapsed, 2),
+        "time_to_first_chunk_ms": summarize([r["ttfc"] for r in ok if r["ttfc"] is not None]),
+        "chunk_end_to_end_ms": summarize([latency for r in ok for latency in r["latencies"]]),
+        "did_fetch_ms": summarize(mock.fetch_times),
+        "chunks_ok": sum(r["successes"] for r in ok),
+        "chunks_failed": sum(r["failures"] for r in ok),
+        "did_posts": mock.posts,
+        "did_injected_errors": mock.errors,
+        "did_fetch_failures": mock.fetch_failures,
+        "app_cpu_s_per_session": round(cpu / args.sessions, 4) if cpu is not None else None,
+        "app_peak_rss_mb": round(peak_rss / 1e6, 1) if peak_rss is not None else None,
+        "warmup": warmup,
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Load-test app.py against a local D-ID stand-in.")
+    parser.add_argument("-n", "--sessions", type=int, default=10)
+    parser.add_argument("-c", "--concurrency", type=int, help="sessions running at once (default: all)")
+    parser.add_argument("--text", help="script to synthesize per session instead of streaming SOURCE_FILE")
+    parser.add_argument("--asset-id", help="prepared asset to stream")
+    parser.add_argument("--chunk-policy", help='JSON chunk policy, e.g. \'{"first_ms": 500}\'')
+    parser.add_argument("--lead-time", type=float, default=1e6,
+                        help="pacing lead time sent with each session (default: effectively unpaced)")
+    parser.add_argument("--did-latency", type=float, default=0.1, help="mock D-ID response time in seconds")
+    parser.add_argument("--did-jitter", type=float, default=0.05)
+    parser.add_argument("--did-error-rate", type=float, default=0.0, help="fraction of POSTs answered with 500")
+    parser.add_argument("--no-fetch", action="store_true", help="mock D-ID does not download the chunks")
+    parser.add_argument("--no-warmup", dest="warmup", action="store_false")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("-q", "--quiet", action="store_true", help="hide the app's output")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(bench(args))
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
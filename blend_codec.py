@@ -0,0 +1,101 @@
+import json
+import struct
+import time
+import zlib
+import numpy as np
+
+# Binary layout of one batch of blend-shape frames (little-endian):
+#   header:  magic, flags, frame index of the first frame, frame count, blend shapes per frame,
+#            quantization scale (value = int16 * scale; unused for float32)
+#   payload: frame count * blend shapes values, float32 or int16, row-major by frame,
+#            zlib-compressed when FLAG_COMPRESSED is set
+MAGIC = b"BSF1"
+HEADER = struct.Struct("<4sBIIHf")
+FLAG_INT16 = 1
+FLAG_DELTA = 2
+FLAG_COMPRESSED = 4
+
+# Encodings accepted by encode_frames / BLEND_SHAPE_ENCODING
+ENCODINGS = {
+    "float32": 0,
+    "int16": FLAG_INT16,
+    "delta-int16": FLAG_INT16 | FLAG_DELTA | FLAG_COMPRESSED,
+    "delta-float32": FLAG_DELTA | FLAG_COMPRESSED,
+}
+
+
+# Concatenate parsed evt.animation payloads ({"FrameIndex": n, "BlendShapes": [[...], ...]})
+# into (index of the first frame, float32 array of shape (frames, blend shapes))
+def stack_animations(animations):
+    if not animations:
+        return 0, np.zeros((0, 0), dtype=np.float32)
+    frames = np.concatenate([np.asarray(a["BlendShapes"], dtype=np.float32).reshape(len(a["BlendShapes"]), -1)
+                             for a in animations])
+    return animations[0]["FrameIndex"], frames
+
+
+def encode_frames(frame_index, frames, encoding="int16"):
+    flags = ENCODINGS[encoding]
+    frames = np.ascontiguousarray(frames, dtype=np.float32)
+    if frames.ndim != 2:
+        frames = frames.reshape(len(frames), -1)
+    scale = 0.0
+    if flags & FLAG_INT16:
+        peak = float(np.abs(frames).max()) if frames.size else 0.0
+        scale = peak / 32767 if peak else 1.0
+        values = np.rint(frames / scale).astype(np.int16)
+    else:
+        values = frames
+    if flags & FLAG_DELTA and len(values) > 1:
+        # Differences between consecutive frames; int16 wraps around, and so does the decoder's cumsum
+        values = np.concatenate([values[:1], np.diff(values, axis=0)])
+    payload = values.astype("<i2" if flags & FLAG_INT16 else "<f4", copy=False).tobytes()
+    if flags & FLAG_COMPRESSED:
+        payload = zlib.compress(payload, 6)
+    return HEADER.pack(MAGIC, flags, frame_index, frames.shape[0], frames.shape[1], scale) + payload
+
+
+# Inverse of encode_frames: (index of the first frame, float32 array of shape (frames, blend shapes))
+def decode_frames(data):
+    magic, flags, frame_index, count, width, scale = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a blend-shape frame batch")
+    payload = memoryview(data)[HEADER.size:]
+    if flags & FLAG_COMPRESSED:
+        payload = zlib.decompress(payload)
+    values = np.frombuffer(payload, dtype="<i2" if flags & FLAG_INT16 else "<f4").reshape(count, width)
+    if flags & FLAG_DELTA:
+        values = np.cumsum(values, axis=0, dtype=values.dtype)
+    if flags & FLAG_INT16:
+        return frame_index, values.astype(np.float32) * np.float32(scale)
+    return frame_index, values.astype(np.float32, copy=False)
+
+
+# Back to the SDK's animation shape, for consumers that still expect JSON
+def to_animation(data):
+    frame_index, frames = decode_frames(data)
+    return {"FrameIndex": frame_index, "BlendShapes": frames.tolist()}
+
+
+# Size and speed against JSON on synthetic, smoothly moving frames: python blend_codec.py [seconds]
+def benchmark(seconds=10.0, fps=60, width=55):
+    t = np.arange(int(seconds * fps), dtype=np.float32)[:, None] / fps
+    frames = (0.5 + 0.5 * np.sin(t * np.linspace(1, 6, width, dtype=np.float32))).astype(np.float32)
+    animations = [{"FrameIndex": i, "BlendShapes": frames[i:i + 30].tolist()} for i in range(0, len(frames), 30)]
+
+    start = time.perf_counter()
+    json_size = len(json.dumps(animations))
+    json_time = time.perf_counter() - start
+    print(f"json: {json_size} bytes, {json_time * 1000:.2f} ms")
+    for encoding in ENCODINGS:
+        start = time.perf_counter()
+        data = encode_frames(*stack_animations(animations), encoding=encoding)
+        elapsed = time.perf_counter() - start
+        error = float(np.abs(decode_frames(data)[1] - frames).max())
+        print(f"{encoding}: {len(data)} bytes ({json_size / len(data):.1f}x smaller), "
+              f"{elapsed * 1000:.2f} ms, max error {error:.2e}")
+
+
+if __name__ == "__main__":
+    import sys
+    benchmark(*[float(a) for a in sys.argv[1:2]])
@@ -0,0 +1,302 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from metrics import stage
+
+# Chunk list and durations, written once every chunk of an entry has been encoded
+INDEX_FILE = "index.json"
+
+# Unindexed directories untouched for this long are leftovers of a process that has gone
+STALE_BUILD_SECONDS = 3600
+
+# A chunk handed to a session: on disk at `path`, or held in the chunk store under `store_key`
+ChunkRef = namedtuple("ChunkRef", "filename duration path store_key")
+
+# Digests of source files, keyed by (path, size, mtime) so unchanged files are hashed once
+_source_digests = {}
+
+
+# Hash the contents of a source file
+def source_digest(source_path):
+    stat = os.stat(source_path)
+    stamp = (os.path.abspath(source_path), stat.st_size, stat.st_mtime_ns)
+    digest = _source_digests.get(stamp)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(source_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        _source_digests[stamp] = digest
+    return digest
+
+
+# Cache key for a source file and the parameters used to chunk and encode it
+def cache_key(source_path, **params):
+    return content_key(source_digest(source_path), **params)
+
+
+# Cache key for content identified by `digest` (e.g. a hash of a TTS script) and its chunking parameters
+def content_key(digest, **params):
+    h = hashlib.sha256(digest.encode())
+    for name in sorted(params):
+        h.update(f"|{name}={params[name]}".encode())
+    return h.hexdigest()[:32]
+
+
+class CacheEntry:
+    def __init__(self, key, path, files, durations, size, complete=True):
+        self.key = key
+        # Distinguishes rebuilds of the same key in the chunk store
+        self.uid = uuid.uuid4().hex[:8]
+        self.path = path
+        self.files = files
+        # Duration of each chunk in seconds
+        self.durations = durations
+        # Bytes on disk; chunks held in the chunk store are listed in `memory` instead
+        self.size = size
+        self.memory = set()
+        self.complete = complete
+        self.error = None
+        # Sessions currently reading this entry; it is not evicted while any are
+        self.readers = 0
+        self.task = None
+        self._changed = asyncio.Event() if not complete else None
+
+    # Wake everyone waiting for the next chunk (or for completion)
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _wait(self):
+        await self._changed.wait()
+
+
+# Encoded chunk sets stored under <root>/<key>/, evicted least-recently-used first.
+# With a ChunkStore, chunks are kept in memory and only written under <root> when the store is full;
+# such entries live only as long as all of their in-memory chunks do.
+class ChunkCache:
+    def __init__(self, root, max_bytes, store=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.store = store
+        if store is not None:
+            store.on_evict = self._invalidate
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._building = {}
+        os.makedirs(root, exist_ok=True)
+        self._load_existing()
+
+    # Index chunk sets left on disk by earlier runs, oldest first
+    def _load_existing(self):
+        found = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path):
+                continue
+            if name.startswith(".") and not name.startswith(".tmp-"):
+                # Not a cache entry (e.g. the per-session directories)
+                continue
+            if name.startswith(".tmp-") or not os.path.exists(os.path.join(path, INDEX_FILE)):
+                # Partial build from an interrupted run, or an entry partly held in memory.
+                # Another process sharing the root may still be using it, so only old ones are removed.
+                if time.time() - os.path.getmtime(path) > STALE_BUILD_SECONDS:
+                    shutil.rmtree(path, ignore_errors=True)
+                continue
+            found.append((os.path.getmtime(path), name, path))
+        for _, name, path in sorted(found):
+            with open(os.path.join(path, INDEX_FILE)) as f:
+                index = json.load(f)
+            files = index["files"]
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in files)
+            # <key>.<uid> from a build, or plain <key> from convert.py --chunked
+            key = name.split(".", 1)[0]
+            older = self.entries.pop(key, None)
+            if older is not None:
+                self.total_bytes -= older.size
+                shutil.rmtree(older.path, ignore_errors=True)
+            self._add(CacheEntry(key, path, files, index["durations"], size))
+        if found:
+            logging.info(f"Chunk cache loaded {len(self.entries)} entries ({self.total_bytes} bytes)")
+        self._evict()
+
+    def _add(self, entry):
+        self.entries[entry.key] = entry
+        self.total_bytes += entry.size
+
+    # Look up a complete entry and mark it as most recently used
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def touch(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+
+    # Yield a ChunkRef for every chunk of key, in order, as soon as it exists.
+    # On a miss, produce(dest_dir) is started as a background build: an async generator
+    # yielding (filename, duration) for each chunk it writes to dest_dir, or
+    # (filename, duration, data) to hand over the encoded bytes instead.
+    # Concurrent sessions for the same key follow that one build instead of starting their own.
+    # Refs are only valid until the caller next awaits, so link or pin them right away.
+    async def chunks(self, key, produce):
+        entry = self.get(key) or self._building.get(key)
+        if entry is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            entry = self._start_build(key, produce)
+
+        entry.readers += 1
+        try:
+            i = 0
+            while True:
+                if i < len(entry.files):
+                    filename = entry.files[i]
+                    if filename in entry.memory:
+                        yield ChunkRef(filename, entry.durations[i], None, self.store_key(entry, filename))
+                    else:
+                        yield ChunkRef(filename, entry.durations[i], os.path.join(entry.path, filename), None)
+                    i += 1
+                elif entry.error is not None:
+                    raise entry.error
+                elif entry.complete:
+                    return
+                else:
+                    await entry._wait()
+        finally:
+            entry.readers -= 1
+
+    def _start_build(self, key, produce):
+        tmp_path = os.path.join(self.root, f".tmp-{key}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(tmp_path)
+        entry = CacheEntry(key, tmp_path, [], [], 0, complete=False)
+        self._building[key] = entry
+        # The build outlives the session that started it, so followers are unaffected if it disconnects
+        entry.task = asyncio.get_running_loop().create_task(self._build(entry, produce))
+        return entry
+
+    async def _build(self, entry, produce):
+        try:
+            async for filename, duration, *data in produce(entry.path):
+                file_path = os.path.join(entry.path, filename)
+                if data:
+                    if self.store is not None and self.store.put(self.store_key(entry, filename), data[0], owner=entry):
+                        entry.memory.add(filename)
+                    else:
+                        # No room in memory: fall back to disk
+                        with stage("disk_write").time():
+                            await asyncio.to_thread(_write_file, file_path, data[0])
+                if filename not in entry.memory:
+                    entry.size += os.path.getsize(file_path)
+                entry.durations.append(duration)
+                entry.files.append(filename)
+                entry._notify()
+            if not entry.memory:
+                # Only entries wholly on disk survive a restart
+                with open(os.path.join(entry.path, INDEX_FILE), "w") as f:
+                    json.dump({"files": entry.files, "durations": entry.durations}, f)
+            # Each build gets its own directory, so releasing an older entry for the same key
+            # can never delete this one's files
+            path = os.path.join(self.root, f"{entry.key}.{entry.uid}")
+            os.rename(entry.path, path)
+        except asyncio.CancelledError:
+            self._fail(entry, RuntimeError(f"Chunk build for {entry.key} was cancelled"))
+            raise
+        except Exception as e:
+            logging.error(f"Chunk cache build for {entry.key} failed: {e}")
+            self._fail(entry, e)
+            return
+
+        del self._building[entry.key]
+        entry.path = path
+        entry.complete = True
+        entry._notify()
+        self._add(entry)
+        self._evict()
+        logging.info(f"Chunk cache stored {entry.key}: {len(entry.files)} chunks, {entry.size} bytes")
+
+    def _fail(self, entry, error):
+        del self._building[entry.key]
+        self._release(entry)
+        entry.error = error
+        entry._notify()
+
+    def store_key(self, entry, filename):
+        return f"{entry.key}.{entry.uid}/{filename}"
+
+    # ChunkRef for one chunk of a complete entry, or None
+    def lookup(self, key, filename):
+        entry = self.get(key)
+        if entry is None or filename not in entry.files:
+            return None
+        duration = entry.durations[entry.files.index(filename)]
+        if filename in entry.memory:
+            return ChunkRef(filename, duration, None, self.store_key(entry, filename))
+        return ChunkRef(filename, duration, os.path.join(entry.path, filename), None)
+
+    # Delete an entry's files and whatever of its chunks no session still holds in memory
+    def _release(self, entry):
+        shutil.rmtree(entry.path, ignore_errors=True)
+        if self.store is not None:
+            for filename in entry.memory:
+                key = self.store_key(entry, filename)
+                chunk = self.store.chunks.get(key)
+                if chunk is not None and not chunk.pins:
+                    self.store.discard(key)
+
+    # The chunk store evicted one of entry's chunks, so it can no longer be served from the cache
+    def _invalidate(self, entry):
+        if self.entries.get(entry.key) is entry:
+            del self.entries[entry.key]
+            self.total_bytes -= entry.size
+            logging.info(f"Chunk cache dropped {entry.key} after a chunk left memory")
+        self._release(entry)
+
+    # Drop least-recently-used entries until the cache fits its size cap.
+    # Entries being read are skipped, and the most recent entry is always kept
+    # so an oversized asset can still be streamed.
+    def _evict(self):
+        for key in list(self.entries)[:-1]:
+            if self.total_bytes <= self.max_bytes:
+                break
+            entry = self.entries[key]
+            if entry.readers:
+                continue
+            del self.entries[key]
+            self.total_bytes -= entry.size
+            self._release(entry)
+            logging.info(f"Chunk cache evicted {key} ({entry.size} bytes)")
+
+    # Cancel builds still in progress
+    async def close(self):
+        tasks = [entry.task for entry in self._building.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "building": len(self._building),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def _write_file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
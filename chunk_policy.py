@@ -0,0 +1,139 @@
+import math
+import numpy as np
+from metrics import stage
+from pcm import PcmBuffer
+
+# Length of the windows whose energy is compared when looking for a cut
+ENERGY_WINDOW_MS = 10
+
+# Smallest chunk a policy may ask for, and the stricter floor for policies sent with a request
+MIN_CHUNK_MS = ENERGY_WINDOW_MS
+MIN_REQUEST_CHUNK_MS = 100
+
+# Limits for policies sent with a request, so a client cannot make one chunk hold the whole stream
+MAX_REQUEST_CHUNK_MS = 30000
+MAX_REQUEST_GROWTH = 4
+
+
+# How long each chunk should be. Chunk i targets first_ms * growth**i, capped at max_ms, and is cut
+# at the quietest point within search_ms of that target. first_ms == max_ms with search_ms 0
+# gives fixed-size chunks.
+class ChunkPolicy:
+    def __init__(self, first_ms=1000, max_ms=5000, growth=2.0, search_ms=400, min_ms=MIN_CHUNK_MS,
+                 limit_ms=math.inf, max_growth=math.inf):
+        if not all(math.isfinite(value) for value in (first_ms, max_ms, growth, search_ms)):
+            raise ValueError("Chunk policy values must be finite numbers")
+        if first_ms < min_ms or max_ms < first_ms:
+            raise ValueError(f"Chunk sizes must satisfy {min_ms:g} <= first_ms <= max_ms")
+        if max_ms > limit_ms:
+            raise ValueError(f"max_ms must be at most {limit_ms:g}")
+        if growth < 1 or growth > max_growth:
+            raise ValueError(f"growth must be between 1 and {max_growth:g}")
+        if search_ms < 0:
+            raise ValueError("search_ms must not be negative")
+        self.first_ms = first_ms
+        self.max_ms = max_ms
+        self.growth = growth
+        self.search_ms = search_ms
+
+    # Build a policy from a request's "chunk_policy" object, filling in omitted fields from `default`
+    @classmethod
+    def from_dict(cls, values, default, min_ms=MIN_REQUEST_CHUNK_MS, limit_ms=MAX_REQUEST_CHUNK_MS,
+                  max_growth=MAX_REQUEST_GROWTH):
+        fields = {**default.as_dict(), **values}
+        unknown = set(fields) - set(default.as_dict())
+        if unknown:
+            raise ValueError(f"Unknown chunk policy fields: {', '.join(sorted(unknown))}")
+        try:
+            # The server's own default is always allowed, even past the request limits
+            return cls(**{name: float(value) for name, value in fields.items()}, min_ms=min_ms,
+                       limit_ms=max(limit_ms, default.max_ms), max_growth=max(max_growth, default.growth))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid chunk policy: {e}")
+
+    def as_dict(self):
+        return {"first_ms": self.first_ms, "max_ms": self.max_ms, "growth": self.growth, "search_ms": self.search_ms}
+
+    # Stable description for cache keys
+    def describe(self):
+        return ",".join(f"{name}={value:g}" for name, value in self.as_dict().items())
+
+    def target_ms(self, index):
+        if self.growth == 1:
+            return self.first_ms
+        # Compared in log space, so chunks far past the cap never compute an overflowing power
+        if index * math.log(self.growth) >= math.log(self.max_ms / self.first_ms):
+            return self.max_ms
+        return self.first_ms * self.growth ** index
+
+
+# Cuts a stream of raw PCM into chunks following a ChunkPolicy, placing each cut in the
+# lowest-energy window near the target size so boundaries fall between words.
+# feed() returns the chunks completed so far; flush() returns the rest. Chunks are (frames, channels)
+# views into the chunker's PcmBuffer, so cutting never copies samples.
+class SilenceChunker:
+    def __init__(self, policy, sample_rate, channels):
+        self.policy = policy
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.window_frames = max(sample_rate * ENERGY_WINDOW_MS // 1000, 1)
+        self.buffer = PcmBuffer(sample_rate, channels)
+        self.index = 0
+
+    def _frames(self, ms):
+        return int(self.sample_rate * ms / 1000)
+
+    # Bounds (in frames) of where the next cut may go
+    def _window(self):
+        target = self._frames(self.policy.target_ms(self.index))
+        search = min(self._frames(self.policy.search_ms), target // 2)
+        return target, target - search, target + search
+
+    def feed(self, pcm):
+        self.buffer.append(pcm)
+        chunks = []
+        while True:
+            target, lo, hi = self._window()
+            if len(self.buffer) < hi:
+                return chunks
+            cut = self.find_cut(lo, hi, target)
+            if cut <= 0:
+                # Target shorter than one frame: leave everything for flush() rather than loop on empty cuts
+                return chunks
+            chunks.append(self.buffer.consume(cut))
+            self.index += 1
+
+    # Whatever is buffered becomes the last chunk (the end of a sentence or of the source)
+    def flush(self):
+        chunks = []
+        if len(self.buffer):
+            chunks.append(self.buffer.consume(len(self.buffer)))
+            self.index += 1
+        return chunks
+
+    # Frame offset of the quietest ENERGY_WINDOW_MS window between frames lo and hi,
+    # or `target` when the range holds less than one window
+    def find_cut(self, lo, hi, target):
+        window = self.window_frames
+        count = (hi - lo) // window
+        if count < 1:
+            return target
+        frames = self.buffer.view(lo, lo + count * window).reshape(count, window, self.channels).astype(np.float32)
+        energy = np.square(frames).mean(axis=(1, 2))
+        # Among equally quiet windows (e.g. digital silence), prefer the one nearest the target
+        centers = lo + np.arange(count) * window + window // 2
+        quietest = np.flatnonzero(energy <= energy.min() * 1.01 + 1e-3)
+        return int(centers[quietest[np.argmin(np.abs(centers[quietest] - target))]])
+
+
+# Re-cut an async iterable of PCM blocks into policy-sized chunks
+async def policy_chunks(blocks, policy, sample_rate, channels):
+    chunker = SilenceChunker(policy, sample_rate, channels)
+    chunk_time = stage("chunk")
+    async for pcm in blocks:
+        with chunk_time.time():
+            chunks = chunker.feed(pcm)
+        for chunk in chunks:
+            yield chunk
+    for chunk in chunker.flush():
+        yield chunk
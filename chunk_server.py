@@ -0,0 +1,115 @@
+import mmap
+import os
+from fastapi.responses import FileResponse, Response
+
+# Chunk URLs never change content, so clients and proxies may keep them
+CACHE_CONTROL = "public, max-age=86400, immutable"
+
+
+# ETag derived from the file identity; hard links of the same chunk share it
+def file_etag(stat):
+    return f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+# Parse a single "bytes=" range against size. Returns (start, end) inclusive,
+# None to serve the whole body, or "unsatisfiable".
+def parse_range(header, size):
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        # Unknown unit or multiple ranges: ignoring Range and sending everything is allowed
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                return "unsatisfiable"
+            start, end = max(size - suffix, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else None
+    except ValueError:
+        return None
+    if end is not None and start > end:
+        # Syntactically invalid, so the header is ignored
+        return None
+    if start >= size:
+        return "unsatisfiable"
+    return start, size - 1 if end is None else min(end, size - 1)
+
+
+# FileResponse for a body _plan() has already decided to send whole. Newer Starlette versions parse
+# Range themselves, which would answer differently from serve_bytes (e.g. multipart 206 for several
+# ranges), so the Range headers are hidden from it.
+class WholeFileResponse(FileResponse):
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            headers = [(name, value) for name, value in scope["headers"] if name not in (b"range", b"if-range")]
+            scope = {**scope, "headers": headers}
+        await super().__call__(scope, receive, send)
+
+
+def _etag_matches(header, etag):
+    if header is None:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+# Work out how to answer a request for a body of `size` bytes.
+# Returns (response, None) when no body is needed, or (None, (start, end, headers)) for the body to send.
+def _plan(request, size, etag, media_type):
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": CACHE_CONTROL,
+    }
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers), None
+
+    start, end = 0, size - 1
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        byte_range = parse_range(range_header, size)
+        if byte_range == "unsatisfiable":
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers), None
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    headers["Content-Length"] = str(end - start + 1 if size else 0)
+    if request.method == "HEAD":
+        status = 206 if "Content-Range" in headers else 200
+        return Response(status_code=status, headers=headers, media_type=media_type), None
+    return None, (start, end, headers)
+
+
+# Serve a chunk file: whole-file GETs go through FileResponse (sendfile where the server supports it),
+# byte ranges are sliced from a memory map, HEAD and conditional GETs never open the file.
+def serve_file(request, path, media_type="audio/mpeg", stat=None):
+    stat = stat or os.stat(path)
+    response, body = _plan(request, stat.st_size, file_etag(stat), media_type)
+    if response is not None:
+        return response
+    start, end, headers = body
+    if "Content-Range" not in headers:
+        return WholeFileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        data = mapped[start:end + 1]
+    return Response(content=data, status_code=206, headers=headers, media_type=media_type)
+
+
+# Serve a chunk held in memory
+def serve_bytes(request, data, etag, media_type="audio/mpeg"):
+    response, body = _plan(request, len(data), etag, media_type)
+    if response is not None:
+        return response
+    start, end, headers = body
+    status = 206 if "Content-Range" in headers else 200
+    content = data if status == 200 else bytes(memoryview(data)[start:end + 1])
+    return Response(content=content, status_code=status, headers=headers, media_type=media_type)
+
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+import uuid
+
+
+class ChunkSession:
+    def __init__(self, namespace, path, stream_id):
+        self.namespace = namespace
+        self.path = path
+        self.stream_id = stream_id
+        self.files = []
+        # Store keys of chunks held in the chunk store, by filename
+        self.memory = {}
+        # Chunks pinned in the store until they are neither unfetched nor unacknowledged
+        self.pinned = set()
+        self.unfetched = set()
+        self.unacked = set()
+        self.last_active = time.monotonic()
+        self.finished_at = None
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+
+# Per-session chunk directories under <root>/<process>/<namespace>/.
+# Every process (e.g. each uvicorn worker sharing CHUNK_DIR) owns its own <process> directory and
+# refreshes its mtime on each sweep; directories nobody has refreshed for the session timeouts are reaped.
+# Cached chunks are hard-linked in, so a session keeps its files even if the cache evicts them,
+# and removing a session never touches files another session is serving.
+# Chunks held in a ChunkStore are pinned instead, until they are both fetched and acknowledged.
+class SessionRegistry:
+    def __init__(self, root, store=None, idle_timeout=600, linger=120, sweep_interval=15):
+        self.base = root
+        self.root = os.path.join(root, f"{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        self.store = store
+        self.idle_timeout = idle_timeout
+        self.linger = linger
+        self.sweep_interval = sweep_interval
+        self.sessions = {}
+        self._reaper = None
+        os.makedirs(self.root)
+        self._reap_stale()
+
+    # Remove directories left behind by processes that have stopped sweeping (crashed or exited)
+    def _reap_stale(self):
+        max_age = max(self.linger, self.idle_timeout) + self.sweep_interval
+        now = time.time()
+        for name in os.listdir(self.base):
+            path = os.path.join(self.base, name)
+            if path == self.root:
+                continue
+            try:
+                stale = now - os.path.getmtime(path) > max_age
+            except OSError:
+                continue
+            if stale:
+                shutil.rmtree(path, ignore_errors=True)
+                logging.info(f"Removed stale chunk session directory {name}")
+
+    def open(self, stream_id=None):
+        namespace = uuid.uuid4().hex
+        path = os.path.join(self.root, namespace)
+        os.makedirs(path)
+        session = ChunkSession(namespace, path, stream_id)
+        self.sessions[namespace] = session
+        return session
+
+    # Expose a cached chunk (a chunk_cache.ChunkRef) inside the session's namespace
+    def link(self, session, chunk):
+        filename = chunk.filename
+        if chunk.store_key is not None:
+            self.store.pin(chunk.store_key)
+            session.memory[filename] = chunk.store_key
+            session.pinned.add(filename)
+            session.unfetched.add(filename)
+            session.unacked.add(filename)
+        else:
+            dest = os.path.join(session.path, filename)
+            try:
+                os.link(chunk.path, dest)
+            except OSError:
+                # Filesystems without hard links (or across devices) get a copy instead
+                shutil.copyfile(chunk.path, dest)
+        session.files.append(filename)
+        session.touch()
+        return filename
+
+    # The avatar service has downloaded a chunk
+    def fetched(self, session, filename):
+        session.unfetched.discard(filename)
+        self._maybe_release(session, filename)
+
+    # D-ID has answered the POST for a chunk; a rejected chunk will never be fetched
+    def acknowledged(self, session, filename, accepted=True):
+        session.unacked.discard(filename)
+        if not accepted:
+            session.unfetched.discard(filename)
+        self._maybe_release(session, filename)
+
+    def _maybe_release(self, session, filename):
+        if filename not in session.pinned or filename in session.unfetched or filename in session.unacked:
+            return
+        session.pinned.discard(filename)
+        self.store.unpin(session.memory[filename])
+
+    def get(self, namespace):
+        return self.sessions.get(namespace)
+
+    # (path, store_key) of a chunk in a live session, or None if the namespace is not a session.
+    # store_key is set for chunks held in memory; released ones are still served while the store keeps them.
+    def resolve(self, namespace, filename):
+        session = self.sessions.get(namespace)
+        if session is None:
+            return None
+        session.touch()
+        return os.path.join(session.path, filename), session.memory.get(filename)
+
+    # Path of a chunk in a session owned by another process sharing the same root, or None.
+    # Only chunks on disk can be served this way; chunks held in memory stay with their process.
+    def find(self, namespace, filename):
+        for name in os.listdir(self.base):
+            path = os.path.join(self.base, name, namespace, filename)
+            if name != os.path.basename(self.root) and os.path.isfile(path):
+                return path
+        return None
+
+    # Mark a session as done; its chunks stay fetchable for `linger` seconds
+    def finish(self, session):
+        if session.finished_at is None:
+            session.finished_at = time.monotonic()
+
+    def remove(self, namespace):
+        session = self.sessions.pop(namespace, None)
+        if session is not None:
+            for filename in session.pinned:
+                self.store.unpin(session.memory[filename])
+            session.pinned.clear()
+            shutil.rmtree(session.path, ignore_errors=True)
+            logging.debug(f"Removed chunk session {namespace}")
+
+    def sweep(self):
+        now = time.monotonic()
+        for namespace, session in list(self.sessions.items()):
+            if session.finished_at is not None:
+                expired = now - max(session.finished_at, session.last_active) > self.linger
+            else:
+                expired = now - session.last_active > self.idle_timeout
+            if expired:
+                self.remove(namespace)
+        # Tell the other processes this directory is still in use
+        os.makedirs(self.root, exist_ok=True)
+        os.utime(self.root)
+        self._reap_stale()
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.error(f"Chunk session sweep failed: {e}")
+
+    def start(self):
+        if self._reaper is None:
+            self._reaper = asyncio.get_running_loop().create_task(self._reap())
+
+    async def stop(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+        for namespace in list(self.sessions):
+            self.remove(namespace)
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def stats(self):
+        return {
+            "active": sum(1 for s in self.sessions.values() if s.finished_at is None),
+            "lingering": sum(1 for s in self.sessions.values() if s.finished_at is not None),
+        }
@@ -0,0 +1,104 @@
+import hashlib
+import logging
+from collections import OrderedDict
+
+
+class StoredChunk:
+    __slots__ = ("data", "etag", "owner", "pins")
+
+    def __init__(self, data, etag, owner):
+        self.data = data
+        self.etag = etag
+        # Object whose `complete` and `readers` decide whether it may still need this chunk
+        self.owner = owner
+        # Sessions that have not yet had this chunk both fetched and acknowledged
+        self.pins = 0
+
+
+# Encoded chunks held in memory within a byte budget.
+# A chunk is pinned while any session is waiting for the avatar service to fetch it or for D-ID
+# to accept it; once released it stays available for reuse until space is needed, then the
+# least-recently-used released chunks go first. When nothing can be evicted, put() refuses
+# and the caller writes the chunk to disk instead.
+class ChunkStore:
+    def __init__(self, max_bytes, on_evict=None):
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.chunks = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def put(self, key, data, owner=None):
+        if key in self.chunks:
+            return True
+        if not self._make_room(len(data)):
+            self.rejected += 1
+            return False
+        etag = f'"{hashlib.blake2b(data, digest_size=12).hexdigest()}"'
+        self.chunks[key] = StoredChunk(data, etag, owner)
+        self.total_bytes += len(data)
+        return True
+
+    def get(self, key):
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.chunks.move_to_end(key)
+        return chunk
+
+    def __contains__(self, key):
+        return key in self.chunks
+
+    def pin(self, key):
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            chunk.pins += 1
+
+    def unpin(self, key):
+        chunk = self.chunks.get(key)
+        if chunk is not None and chunk.pins > 0:
+            chunk.pins -= 1
+
+    # Remove a chunk without notifying its owner
+    def discard(self, key):
+        chunk = self.chunks.pop(key, None)
+        if chunk is not None:
+            self.total_bytes -= len(chunk.data)
+
+    def _evictable(self, chunk):
+        owner = chunk.owner
+        return chunk.pins == 0 and (owner is None or (owner.complete and not owner.readers))
+
+    def _make_room(self, needed):
+        if needed > self.max_bytes:
+            return False
+        for key in list(self.chunks):
+            if self.total_bytes + needed <= self.max_bytes:
+                break
+            chunk = self.chunks.get(key)
+            if chunk is None or not self._evictable(chunk):
+                continue
+            self.discard(key)
+            self.evicted += 1
+            logging.debug(f"Chunk store evicted {key}")
+            if self.on_evict is not None and chunk.owner is not None:
+                # The owner may discard its other chunks from the store here
+                self.on_evict(chunk.owner)
+        return self.total_bytes + needed <= self.max_bytes
+
+    def stats(self):
+        return {
+            "chunks": len(self.chunks),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "pinned": sum(1 for c in self.chunks.values() if c.pins),
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+        }
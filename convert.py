@@ -1,5 +1,247 @@
-from pydub import AudioSegment
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from assets import Asset, asset_root, load_assets, save_assets
+from chunk_cache import INDEX_FILE, content_key, source_digest
+from chunk_policy import ChunkPolicy, SilenceChunker
+from pcm import PcmBuffer, encode, write_wav
 
-# Load file MP3 dan konversi ke WAV
-audio = AudioSegment.from_mp3("audio.mp3")
-audio.export("audio.wav", format="wav")
+# Format PCM dan chunk policy default, sama dengan app.py supaya chunk set bisa langsung dipakai /stream-audio
+STREAM_SAMPLE_RATE = int(os.getenv("STREAM_SAMPLE_RATE", 22050))
+STREAM_CHANNELS = int(os.getenv("STREAM_CHANNELS", 1))
+CHUNK_SIZE_MS = int(os.getenv("CHUNK_SIZE_MS", 5000))
+CHUNK_FIRST_MS = int(os.getenv("CHUNK_FIRST_MS", 1000))
+CHUNK_GROWTH = float(os.getenv("CHUNK_GROWTH", 2.0))
+CHUNK_SEARCH_MS = int(os.getenv("CHUNK_SEARCH_MS", 400))
+
+# Ekstensi file audio yang diambil dari direktori input
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".ogg", ".opus", ".flac", ".m4a", ".aac"}
+
+# Manifest hasil konversi sebelumnya di direktori output
+MANIFEST_FILE = "manifest.json"
+
+
+# Kumpulkan file input dari path, direktori (rekursif) atau pola glob
+def find_sources(inputs):
+    sources = []
+    for pattern in inputs:
+        paths = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        for path in paths:
+            if os.path.isdir(path):
+                for root, _, files in os.walk(path):
+                    sources.extend(
+                        os.path.join(root, f) for f in files if os.path.splitext(f)[1].lower() in AUDIO_EXTENSIONS
+                    )
+            elif os.path.isfile(path):
+                sources.append(path)
+            else:
+                print(f"Skipping {path}: not found")
+    return sorted(set(os.path.abspath(path) for path in sources))
+
+
+# Nama output per sumber: nama file tanpa ekstensi, ditambah potongan hash kalau ada sumber lain
+# dengan nama yang sama di direktori berbeda
+def output_names(sources, digests):
+    stems = [os.path.splitext(os.path.basename(source))[0] for source in sources]
+    return {
+        source: stem if stems.count(stem) == 1 else f"{stem}-{digests[source][:8]}"
+        for source, stem in zip(sources, stems)
+    }
+
+
+# Parameter yang menentukan hasil konversi; berubah berarti file dikonversi ulang
+def job_params(args, policy):
+    params = {
+        "format": args.format, "chunked": args.chunked, "prepare": args.prepare,
+        "sample_rate": args.sample_rate, "channels": args.channels,
+    }
+    if args.chunked:
+        params["chunk_policy"] = policy.describe()
+    return params
+
+
+# Konversi satu file (dijalankan di worker process). Hasilnya dict berisi output dan statistik.
+def convert_file(source, digest, output_name, output_dir, params, policy_fields):
+    start = time.perf_counter()
+    audio = PcmBuffer.from_file(source, params["sample_rate"], params["channels"])
+    frames = audio.view()
+    index = None
+    if params["chunked"]:
+        asset_id = output_name if params["prepare"] else None
+        path, index = write_chunk_set(digest, audio, output_dir, params, ChunkPolicy(**policy_fields), asset_id)
+        outputs = [path]
+    else:
+        path = os.path.join(output_dir, f"{output_name}.{params['format']}")
+        if params["format"] == "wav":
+            write_wav(path, frames, audio.sample_rate)
+        else:
+            encode(frames, audio.sample_rate, params["format"], path=path)
+        outputs = [path]
+    return {
+        "source": source,
+        "digest": digest,
+        "params": params,
+        "outputs": outputs,
+        "index": index,
+        "duration": audio.duration,
+        "input_bytes": os.path.getsize(source),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+# Tulis chunk set dengan layout cache (<root>/<key>/chunk_N.<format> + index.json), atau dengan asset_id
+# sebagai asset siap pakai di <root>/.assets/<asset_id>/. Ditulis lewat direktori sementara supaya
+# cache tidak pernah melihat set yang setengah jadi. Mengembalikan path dan isi index.json.
+def write_chunk_set(digest, audio, root, params, policy, asset_id=None):
+    # Kunci yang sama dengan cache_key() di app.py untuk file sumber yang sama
+    key = content_key(
+        digest, chunk_policy=params["chunk_policy"], format=params["format"],
+        sample_rate=params["sample_rate"], channels=params["channels"],
+    )
+    parent = asset_root(root) if asset_id else root
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = os.path.join(parent, f".tmp-{key}-{uuid.uuid4().hex[:8]}")
+    os.makedirs(tmp_path)
+    try:
+        chunker = SilenceChunker(policy, audio.sample_rate, audio.channels)
+        index = {"files": [], "durations": [], "sizes": [], "hashes": []}
+        for i, chunk in enumerate(chunker.feed(audio.view()) + chunker.flush()):
+            filename = f"chunk_{i}.{params['format']}"
+            data = encode(chunk, audio.sample_rate, params["format"])
+            with open(os.path.join(tmp_path, filename), "wb") as f:
+                f.write(data)
+            index["files"].append(filename)
+            index["durations"].append(len(chunk) / audio.sample_rate)
+            index["sizes"].append(len(data))
+            index["hashes"].append(hashlib.sha256(data).hexdigest())
+        with open(os.path.join(tmp_path, INDEX_FILE), "w") as f:
+            json.dump(index, f)
+        path = os.path.join(parent, asset_id or key)
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp_path, path)
+        return path, index
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path, manifest):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# File yang sudah dikonversi dengan isi dan parameter yang sama, dan outputnya masih ada
+def up_to_date(entry, digest, params):
+    return (
+        entry is not None and entry["digest"] == digest and entry["params"] == params
+        and all(os.path.exists(path) for path in entry["outputs"])
+    )
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Convert audio files to WAV, MP3 or Opus, optionally as chunk sets for /stream-audio.")
+    parser.add_argument("inputs", nargs="*", default=["audio.mp3"], help="files, directories or glob patterns")
+    parser.add_argument("-o", "--output", default=".", help="output directory (use the chunk cache directory, e.g. audio_chunks, for --chunked)")
+    parser.add_argument("-f", "--format", choices=["wav", "mp3", "opus"], default="wav")
+    parser.add_argument("--chunked", action="store_true", help="write chunk sets in the /stream-audio cache layout (mp3 or opus)")
+    parser.add_argument("--prepare", action="store_true", help="write chunk sets as prepared assets (asset id = file name) for /stream-audio's asset_id; implies --chunked (app.py serves mp3 assets only)")
+    parser.add_argument("--sample-rate", type=int, help="output sample rate (default: source rate, or STREAM_SAMPLE_RATE for --chunked)")
+    parser.add_argument("--channels", type=int, help="output channels (default: source channels, or STREAM_CHANNELS for --chunked)")
+    parser.add_argument("--first-ms", type=float, default=CHUNK_FIRST_MS)
+    parser.add_argument("--max-ms", type=float, default=CHUNK_SIZE_MS)
+    parser.add_argument("--growth", type=float, default=CHUNK_GROWTH)
+    parser.add_argument("--search-ms", type=float, default=CHUNK_SEARCH_MS)
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--force", action="store_true", help="convert even if the manifest says a file is unchanged")
+    args = parser.parse_args(argv)
+    args.chunked = args.chunked or args.prepare
+    if args.chunked and args.format == "wav":
+        parser.error("--chunked needs --format mp3 or opus")
+    if args.chunked:
+        args.sample_rate = args.sample_rate or STREAM_SAMPLE_RATE
+        args.channels = args.channels or STREAM_CHANNELS
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    policy = ChunkPolicy(args.first_ms, args.max_ms, args.growth, args.search_ms)
+    params = job_params(args, policy)
+    os.makedirs(args.output, exist_ok=True)
+    manifest_path = os.path.join(args.output, MANIFEST_FILE)
+    manifest = load_manifest(manifest_path)
+    assets = load_assets(args.output) if args.prepare else None
+
+    sources = find_sources(args.inputs)
+    digests = {source: source_digest(source) for source in sources}
+    names = output_names(sources, digests)
+    pending, skipped = [], 0
+    for source in sources:
+        if not args.force and up_to_date(manifest.get(source), digests[source], params):
+            skipped += 1
+        else:
+            pending.append(source)
+    print(f"{len(sources)} files: {len(pending)} to convert, {skipped} unchanged")
+
+    start = time.perf_counter()
+    done, failed, audio_seconds, input_bytes = 0, 0, 0.0, 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {
+            pool.submit(convert_file, source, digests[source], names[source], args.output, params, policy.as_dict()): source
+            for source in pending
+        }
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"Failed to convert {source}: {e}")
+                continue
+            done += 1
+            audio_seconds += result["duration"]
+            input_bytes += result["input_bytes"]
+            manifest[source] = {key: result[key] for key in ("digest", "params", "outputs", "duration")}
+            if assets is not None:
+                asset_id = names[source]
+                assets[asset_id] = Asset(
+                    asset_id, result["outputs"][0], format=params["format"], sample_rate=params["sample_rate"],
+                    channels=params["channels"], **{key: result["index"][key] for key in ("files", "durations", "sizes", "hashes")},
+                )
+            # Simpan manifest secara berkala supaya run yang terputus tidak mengulang semuanya
+            if done % 50 == 0:
+                save_manifest(manifest_path, manifest)
+                if assets is not None:
+                    save_assets(args.output, assets)
+    save_manifest(manifest_path, manifest)
+    if assets is not None:
+        save_assets(args.output, assets)
+
+    elapsed = time.perf_counter() - start
+    rate = elapsed or 1e-9
+    print(
+        f"Converted {done} files ({failed} failed) in {elapsed:.2f}s with {args.jobs} workers: "
+        f"{done / rate:.1f} files/s, {audio_seconds / rate:.1f}x realtime, {input_bytes / rate / 1e6:.2f} MB/s"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
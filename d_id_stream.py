@@ -1,18 +1,26 @@
 import asyncio
+import logging
 import random
 import os
+import sys
+import time
+import uuid
+from collections import deque
 import cv2
 import numpy as np
-from aiohttp import ClientSession, ClientResponseError
+from aiohttp import ClientResponseError
 from aiortc import (
-    RTCPeerConnection, 
-    RTCSessionDescription, 
-    RTCConfiguration, 
-    RTCIceServer, 
+    RTCPeerConnection,
+    RTCSessionDescription,
+    RTCConfiguration,
+    RTCIceServer,
     MediaStreamTrack
 )
 from aiortc.contrib.media import MediaRecorder
+from aiortc.sdp import candidate_to_sdp
 from dotenv import load_dotenv
+from http_pool import get_aiohttp_session, close_http_clients
+from metrics import Counter, Gauge, SampledLogger, serve_metrics, stage
 
 # Load environment variables from .env file
 load_dotenv()
@@ -38,17 +46,28 @@ presenter_input_by_service = {
     }
 }
 
-# Global variables
-peer_connection = None
-pc_data_channel = None
-stream_id = None
-session_id = None
-session_client_answer = None
-is_stream_ready = False
-stream_warmup = True
-last_bytes_received = 0
-video_is_playing = False
-stream_video_opacity = 0
+# Port for a Prometheus /metrics endpoint with signaling timings (0 disables it)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+
+# Avatar streams one process may hold at once, and seconds without activity before a stream is closed
+STREAM_MAX_SESSIONS = int(os.getenv("STREAM_MAX_SESSIONS", 50))
+STREAM_IDLE_TIMEOUT = int(os.getenv("STREAM_IDLE_TIMEOUT", 300))
+
+# Streams kept connected and warmed up ahead of users (0 disables the pool), seconds a pooled stream
+# may take to connect, and age after which an unused pooled stream is replaced before D-ID expires it
+STREAM_POOL_SIZE = int(os.getenv("STREAM_POOL_SIZE", 0))
+STREAM_POOL_CONNECT_TIMEOUT = float(os.getenv("STREAM_POOL_CONNECT_TIMEOUT", 15))
+STREAM_POOL_MAX_AGE = float(os.getenv("STREAM_POOL_MAX_AGE", 240))
+
+# Local ICE candidates found within this many seconds of each other are POSTed to D-ID as one batch
+ICE_BATCH_WINDOW = float(os.getenv("ICE_BATCH_WINDOW", 0.02))
+
+log = SampledLogger("d_id_stream")
+
+ICE_CANDIDATES = Counter("avatar_ice_candidates_total", "Local ICE candidates sent to D-ID by outcome", ["result"])
+OPEN_STREAMS = Gauge("avatar_streams", "Avatar streams held by the stream manager")
+POOLED_STREAMS = Gauge("avatar_stream_pool", "Pre-warmed streams by state", ["state"])
+POOL_REQUESTS = Counter("avatar_stream_pool_requests_total", "Streams opened from the warm pool or connected on demand", ["result"])
 
 async def fetch_with_retries(session, url, method='GET', json_data=None, retries=1):
     try:
@@ -68,31 +87,189 @@ async def fetch_with_retries(session, url, method='GET', json_data=None, retries
             print(f"Failed to fetch {url} after {retries} attempts")
             raise e
 
-async def connect():
-    global peer_connection, session_client_answer, stream_id, session_id, is_stream_ready
+# Function to adjust SDP to ensure compatibility with aiortc
+def adjust_sdp(sdp):
+    # Example adjustment: replace H264 with VP8, which is widely supported by aiortc
+    sdp = sdp.replace('H264/90000', 'VP8/90000')
+    # Additional adjustments can be made here if needed
+    return sdp
 
-    if peer_connection:
-        if peer_connection.connectionState == 'connected':
+# Local ICE candidates in an SDP as (candidate, sdpMid, sdpMLineIndex), each candidate once
+# (with BUNDLE the same candidates are repeated in every media section)
+def sdp_candidates(sdp):
+    candidates = {}
+    mline_index, mid = -1, None
+    for line in sdp.splitlines():
+        if line.startswith('m='):
+            mline_index, mid = mline_index + 1, None
+        elif line.startswith('a=mid:'):
+            mid = line[len('a=mid:'):]
+        elif line.startswith('a=candidate:') and mline_index >= 0:
+            candidates.setdefault(line[len('a='):], (mid, mline_index))
+    return [(candidate, mid, index) for candidate, (mid, index) in candidates.items()]
+
+# Sends a stream's local ICE candidates to D-ID: candidates added within `window` seconds of each
+# other go out as one batch of parallel POSTs over the shared session, and end() waits for them
+# and sends the end-of-candidates marker (a POST without a candidate)
+class IceBatcher:
+    def __init__(self, url, session_id, window=ICE_BATCH_WINDOW):
+        self.url = url
+        self.session_id = session_id
+        self.window = window
+        self.pending = []
+        self.sent = set()
+        self.ended = False
+        self._timer = None
+        self._tasks = set()
+
+    def add(self, candidate, sdp_mid, sdp_mline_index):
+        if candidate in self.sent or self.ended:
+            return
+        self.sent.add(candidate)
+        self.pending.append({
+            'candidate': candidate,
+            'sdpMid': sdp_mid,
+            'sdpMLineIndex': sdp_mline_index,
+            'session_id': self.session_id,
+        })
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch):
+        session = get_aiohttp_session()
+        with stage("ice_post").time():
+            results = await asyncio.gather(
+                *(fetch_with_retries(session, self.url, 'POST', body) for body in batch), return_exceptions=True
+            )
+        for body, result in zip(batch, results):
+            if isinstance(result, Exception):
+                ICE_CANDIDATES.labels(result="failed").inc()
+                print(f"Error sending ICE candidate: {result}")
+            else:
+                ICE_CANDIDATES.labels(result="sent").inc()
+                log.event("ice_candidate_sent", url=self.url, mid=body['sdpMid'], candidate=body['candidate'])
+
+    async def end(self):
+        if self.ended:
+            return
+        self._flush()
+        self.ended = True
+        await asyncio.gather(*self._tasks)
+        try:
+            await fetch_with_retries(get_aiohttp_session(), self.url, 'POST', {'session_id': self.session_id})
+        except Exception as e:
+            print(f"Error sending end of ICE candidates: {e}")
+
+    def cancel(self):
+        self.ended = True
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for task in self._tasks:
+            task.cancel()
+
+# Show a stream's video in its own OpenCV window until 'q' is pressed
+async def show_video(stream, track):
+    # Create a media recorder to handle incoming video frames
+    recorder = MediaRecorder(f"output_{stream.key}.mp4")  # Save video to a file if needed
+    await recorder.start()
+    try:
+        while True:
+            frame = await track.recv()
+            stream.touch()
+            # Convert frame to numpy array
+            img = frame.to_ndarray(format="bgr24")
+            # Display using OpenCV
+            cv2.imshow(f"Video Frame {stream.key}", img)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    except Exception as e:
+        print(f"Error receiving frame: {e}")
+    finally:
+        await recorder.stop()
+
+# One avatar session: a D-ID stream and the RTCPeerConnection receiving it.
+# on_video(stream, track) is awaited with the incoming video track; the track is also kept in
+# video_track, so an on_video set after it arrived can still be started.
+class AvatarStream:
+    def __init__(self, key, on_video=None, stream_warmup=True):
+        self.key = key
+        self.on_video = on_video
+        self.stream_warmup = stream_warmup
+        self.peer_connection = None
+        self.data_channel = None
+        self.stream_id = None
+        self.session_id = None
+        self.client_answer = None
+        self.ice = None
+        self.video_opacity = 0
+        self.connect_started = None
+        self.connecting = False
+        self.closed = False
+        self.created = time.monotonic()
+        self.last_active = self.created
+        self.connected = asyncio.Event()
+        self.video_track = None
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    @property
+    def age(self):
+        return time.monotonic() - self.created
+
+    # Wait until the peer connection is up, or raise asyncio.TimeoutError
+    async def wait_connected(self, timeout):
+        await asyncio.wait_for(self.connected.wait(), timeout)
+        if self.connection_state != 'connected':
+            raise RuntimeError(f"Stream {self.key} closed while connecting")
+
+    @property
+    def connection_state(self):
+        return self.peer_connection.connectionState if self.peer_connection else 'closed'
+
+    # Whether the stream is, or is about to be, usable for talks
+    @property
+    def alive(self):
+        return not self.closed and (self.connecting or self.connection_state in ('new', 'connecting', 'connected'))
+
+    async def connect(self):
+        if self.peer_connection and self.peer_connection.connectionState == 'connected':
             return
 
-    await stop_all_streams()
-    await close_pc()
+        await self.stop_all_streams()
+        await self.close_pc()
+        self.connected = asyncio.Event()
+        self.video_track = None
+
+        # Shared keep-alive session for all signaling requests
+        session = get_aiohttp_session()
+        self.connect_started = time.perf_counter()
+        self.connecting = True
 
-    async with ClientSession() as session:
         try:
-            response = await fetch_with_retries(
+            data = await fetch_with_retries(
                 session,
                 f"{DID_API['url']}/{DID_API['service']}/streams",
                 'POST',
                 {
                     **presenter_input_by_service[DID_API['service']],
-                    'stream_warmup': stream_warmup
+                    'stream_warmup': self.stream_warmup
                 }
             )
 
-            data = response
-            stream_id = data['id']
-            session_id = data['session_id']
+            self.stream_id = data['id']
+            self.session_id = data['session_id']
 
             # Adjust the SDP offer for codec compatibility
             adjusted_sdp = adjust_sdp(data['offer']['sdp'])
@@ -100,174 +277,355 @@ async def connect():
 
             ice_servers = [RTCIceServer(ice.get('urls'), ice.get('username'), ice.get('credential'), None) for ice in data['ice_servers']]
 
+            self.ice = IceBatcher(
+                f"{DID_API['url']}/{DID_API['service']}/streams/{self.stream_id}/ice", self.session_id
+            )
+
             try:
-                session_client_answer = await create_peer_connection(offer, ice_servers)
+                with stage("sdp").time():
+                    self.client_answer = await self.create_peer_connection(offer, ice_servers)
             except Exception as e:
-                print('Error during streaming setup:', e)
-                await stop_all_streams()
-                await close_pc()
-                return
+                print(f'[{self.key}] Error during streaming setup:', e)
+                await self.stop_all_streams()
+                await self.close_pc()
+                raise
 
-            try:
+            # aiortc gathers every local candidate before the answer is ready and puts them in the SDP
+            # instead of trickling them, so they are submitted from there, while the answer is being posted
+            for candidate, sdp_mid, sdp_mline_index in sdp_candidates(self.peer_connection.localDescription.sdp):
+                self.ice.add(candidate, sdp_mid, sdp_mline_index)
+            await asyncio.gather(self.send_answer(session), self.ice.end())
+
+            print(f'[{self.key}] Stream ID:', self.stream_id)
+            print(f'[{self.key}] Session ID:', self.session_id)
+
+        except Exception as e:
+            print(f'[{self.key}] Error connecting to service:', e)
+            raise
+        finally:
+            self.connecting = False
+
+    async def send_answer(self, session):
+        try:
+            with stage("sdp_post").time():
                 await fetch_with_retries(
                     session,
-                    f"{DID_API['url']}/{DID_API['service']}/streams/{stream_id}/sdp",
+                    f"{DID_API['url']}/{DID_API['service']}/streams/{self.stream_id}/sdp",
                     'POST',
                     {
                         'answer': {
-                            'sdp': session_client_answer.sdp,
-                            'type': session_client_answer.type
+                            'sdp': self.client_answer.sdp,
+                            'type': self.client_answer.type
                         },
-                        'session_id': session_id
+                        'session_id': self.session_id
                     }
                 )
-                print("Successfully sent SDP answer to service")
-            except Exception as e:
-                print('Error sending SDP answer to service:', e)
+            print(f"[{self.key}] Successfully sent SDP answer to service")
+        except Exception as e:
+            print(f'[{self.key}] Error sending SDP answer to service:', e)
 
-            print('Stream ID:', stream_id)
-            print('Session ID:', session_id)
+    async def destroy(self):
+        self.closed = True
+        if self.stream_id is not None:
+            try:
+                await fetch_with_retries(
+                    get_aiohttp_session(),
+                    f"{DID_API['url']}/{DID_API['service']}/streams/{self.stream_id}",
+                    'DELETE',
+                    {'session_id': self.session_id}
+                )
+                print(f"[{self.key}] Successfully destroyed stream")
+            except Exception as e:
+                print(f"[{self.key}] Error destroying stream: {e}")
+        await self.stop_all_streams()
+        await self.close_pc()
+
+    async def create_peer_connection(self, offer, ice_servers):
+        config = RTCConfiguration(ice_servers)
+        pc = self.peer_connection = RTCPeerConnection(config)
+
+        self.data_channel = pc.createDataChannel('JanusDataChannel')
+
+        @pc.on('icegatheringstatechange')
+        def on_ice_gathering_state_change():
+            print(f"[{self.key}] ICE gathering state changed: {pc.iceGatheringState}")
+
+        # Trickled candidates, should the peer connection emit any, join the same batches
+        @pc.on('icecandidate')
+        async def on_ice_candidate(event):
+            if event.candidate:
+                candidate = event.candidate
+                self.ice.add(f"candidate:{candidate_to_sdp(candidate)}", candidate.sdpMid, candidate.sdpMLineIndex)
+            else:
+                print(f'[{self.key}] Received null ICE candidate.')
+                await self.ice.end()
+
+        @pc.on('iceconnectionstatechange')
+        async def on_ice_connection_state_change():
+            print(f"[{self.key}] ICE connection state changed: {pc.iceConnectionState}")
+            if pc.iceConnectionState in ['failed', 'closed']:
+                print(f"[{self.key}] ICE connection failed or closed")
+                await self.stop_all_streams()
+                await self.close_pc()
+
+        @pc.on('connectionstatechange')
+        def on_connection_state_change():
+            print(f"[{self.key}] Connection state changed: {pc.connectionState}")
+            if pc.connectionState == 'connected' and self.connect_started is not None:
+                stage("connected").observe(time.perf_counter() - self.connect_started)
+                self.connect_started = None
+                self.touch()
+            if pc.connectionState == 'connected':
+                self.connected.set()
+
+        @pc.on('signalingstatechange')
+        def on_signaling_state_change():
+            print(f"[{self.key}] Signaling state changed: {pc.signalingState}")
+
+        @pc.on('track')
+        async def on_track(track: MediaStreamTrack):
+            print(f"[{self.key}] Received track: {track.kind}")
+            if track.kind == "video":
+                self.video_track = track
+                if self.on_video is not None:
+                    await self.on_video(self, track)
+
+        @self.data_channel.on('message')
+        def on_message(message):
+            self.touch()
+            print(f"[{self.key}] Data channel message received: {message}")
+
+        print(f'[{self.key}] Created peer connection')
 
+        try:
+            await pc.setRemoteDescription(offer)
+            print(f'[{self.key}] Set remote SDP')
         except Exception as e:
-            print('Error connecting to service:', e)
+            print(f'[{self.key}] Failed to set remote SDP:', e)
+            raise e
 
-async def destroy():
-    async with ClientSession() as session:
         try:
-            await fetch_with_retries(
-                session,
-                f"{DID_API['url']}/{DID_API['service']}/streams/{stream_id}",
-                'DELETE',
-                {'session_id': session_id}
-            )
-            print("Successfully destroyed stream")
+            answer = await pc.createAnswer()
+            print(f'[{self.key}] Created local SDP')
+            await pc.setLocalDescription(answer)
+            print(f'[{self.key}] Set local SDP')
         except Exception as e:
-            print(f"Error destroying stream: {e}")
-    await stop_all_streams()
-    await close_pc()
-
-# Function to adjust SDP to ensure compatibility with aiortc
-def adjust_sdp(sdp):
-    # Example adjustment: replace H264 with VP8, which is widely supported by aiortc
-    sdp = sdp.replace('H264/90000', 'VP8/90000')
-    # Additional adjustments can be made here if needed
-    return sdp
+            print(f'[{self.key}] Error creating or setting local SDP:', e)
+            raise e
 
-async def create_peer_connection(offer, ice_servers):
-    global peer_connection, pc_data_channel
-    config = RTCConfiguration(ice_servers)
-    peer_connection = RTCPeerConnection(config)
-
-    pc_data_channel = peer_connection.createDataChannel('JanusDataChannel')
-
-    @peer_connection.on('icegatheringstatechange')
-    def on_ice_gathering_state_change():
-        print(f"ICE gathering state changed: {peer_connection.iceGatheringState}")
-
-    @peer_connection.on('icecandidate')
-    async def on_ice_candidate(event):
-        if event.candidate:
-            print('Received ICE candidate')
-            candidate = event.candidate.candidate
-            sdp_mid = event.candidate.sdpMid
-            sdp_mline_index = event.candidate.sdpMLineIndex
-
-            url = f"{DID_API['url']}/{DID_API['service']}/streams/{stream_id}/ice"
-            body = {
-                'candidate': candidate,
-                'sdpMid': sdp_mid,
-                'sdpMLineIndex': sdp_mline_index,
-                'session_id': session_id,
-            }
-
-            async with ClientSession() as session:
-                try:
-                    await fetch_with_retries(session, url, 'POST', body)
-                    print("Successfully sent ICE candidate to service")
-                except Exception as e:
-                    print(f"Error sending ICE candidate: {e}")
-        else:
-            print('Received null ICE candidate.')
-
-    @peer_connection.on('iceconnectionstatechange')
-    async def on_ice_connection_state_change():
-        print(f"ICE connection state changed: {peer_connection.iceConnectionState}")
-        if peer_connection.iceConnectionState in ['failed', 'closed']:
-            print("ICE connection failed or closed")
-            await stop_all_streams()
-            await close_pc()
-
-    @peer_connection.on('connectionstatechange')
-    def on_connection_state_change():
-        print(f"Connection state changed: {peer_connection.connectionState}")
-
-    @peer_connection.on('signalingstatechange')
-    def on_signaling_state_change():
-        print(f"Signaling state changed: {peer_connection.signalingState}")
-
-    @peer_connection.on('track')
-    async def on_track(track: MediaStreamTrack):
-        print(f"Received track: {track.kind}")
-        if track.kind == "video":
-            print("Video track received")
-            # Create a media recorder to handle incoming video frames
-            recorder = MediaRecorder("output.mp4")  # Save video to a file if needed
-            await recorder.start()
+        return answer
+
+    async def stop_all_streams(self):
+        if self.peer_connection:
+            print(f'[{self.key}] Stopping video streams')
+            self.video_opacity = 0
+
+    async def close_pc(self):
+        if self.ice is not None:
+            self.ice.cancel()
+        pc, self.peer_connection = self.peer_connection, None
+        # Wake anyone waiting for the connection; they see it is no longer alive
+        self.connected.set()
+        if pc:
+            print(f'[{self.key}] Closing peer connection')
+            await pc.close()
+
+# Avatar streams held by one process on one event loop, keyed by the caller's session key.
+# open() reuses a live stream for the key, at most max_streams exist at once, and a reaper
+# destroys streams idle for idle_timeout seconds or whose connection failed.
+# With pool_size, that many streams are connected and warmed up in the background so open() can
+# hand one over instantly; pooled streams that fail or reach max_age are replaced.
+class StreamManager:
+    def __init__(self, max_streams=STREAM_MAX_SESSIONS, idle_timeout=STREAM_IDLE_TIMEOUT, sweep_interval=15,
+                 on_video=None, pool_size=STREAM_POOL_SIZE, connect_timeout=STREAM_POOL_CONNECT_TIMEOUT,
+                 max_age=STREAM_POOL_MAX_AGE):
+        self.max_streams = max_streams
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.on_video = on_video
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.max_age = max_age
+        self.streams = {}
+        # Connected streams not yet handed to anyone, oldest first, and the tasks connecting more
+        self.warm = deque()
+        self._warming = set()
+        # Background tasks (destroying discarded streams, video of handed-over ones), kept until done
+        self._tasks = set()
+        self._reaper = None
+        OPEN_STREAMS.set_function(lambda: len(self.streams))
+        POOLED_STREAMS.labels(state="warm").set_function(lambda: len(self.warm))
+        POOLED_STREAMS.labels(state="warming").set_function(lambda: len(self._warming))
+
+    # Live stream for `key`: the existing one, a pre-warmed one, or a newly connected one
+    async def open(self, key=None):
+        key = key or uuid.uuid4().hex
+        stream = self.streams.get(key)
+        if stream is not None:
+            if stream.alive:
+                stream.touch()
+                return stream
+            await self.close(key)
+        stream = self._take_warm()
+        # At the limit with pooled streams still connecting: wait for one of those rather than fail
+        while stream is None and self._warming and len(self.streams) + len(self._warming) >= self.max_streams:
+            await asyncio.wait(set(self._warming), return_when=asyncio.FIRST_COMPLETED)
+            stream = self._take_warm()
+        if stream is not None:
+            POOL_REQUESTS.labels(result="hit").inc()
+            print(f"[{key}] Attached pre-warmed stream {stream.stream_id}")
+            stream.key = key
+            stream.touch()
+            self.streams[key] = stream
+            # Pooled streams have no viewer until now; start video that arrived while warming
+            stream.on_video = self.on_video
+            if self.on_video is not None and stream.video_track is not None:
+                self._spawn(self.on_video(stream, stream.video_track))
+            self._refill()
+            return stream
+        if self.pool_size:
+            POOL_REQUESTS.labels(result="miss").inc()
+        if len(self.streams) + len(self._warming) >= self.max_streams:
+            raise RuntimeError(f"Stream limit reached ({self.max_streams} streams)")
+        stream = self.streams[key] = AvatarStream(key, on_video=self.on_video)
+        try:
+            await stream.connect()
+        except BaseException:
+            await self.close(key)
+            raise
+        return stream
+
+    # Oldest healthy pooled stream, discarding any that went bad since the last sweep
+    def _take_warm(self):
+        while self.warm:
+            stream = self.warm.popleft()
+            if self._healthy(stream):
+                return stream
+            self._spawn(stream.destroy())
+        return None
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _healthy(self, stream):
+        return stream.connection_state == 'connected' and stream.age < self.max_age
+
+    # Start connecting streams until the pool is back to pool_size, within max_streams
+    def _refill(self):
+        loop = asyncio.get_running_loop()
+        while (
+            len(self.warm) + len(self._warming) < self.pool_size
+            and len(self.streams) + len(self.warm) + len(self._warming) < self.max_streams
+        ):
+            task = loop.create_task(self._warm_one())
+            self._warming.add(task)
+            task.add_done_callback(self._warming.discard)
+
+    async def _warm_one(self):
+        # on_video is only set once open() hands the stream to someone
+        stream = AvatarStream(f"pool-{uuid.uuid4().hex[:8]}")
+        try:
+            await stream.connect()
+            await stream.wait_connected(self.connect_timeout)
+        except asyncio.CancelledError:
+            await stream.destroy()
+            raise
+        except Exception as e:
+            # Not retried until the next sweep, so an unreachable service is not hammered
+            print(f"[{stream.key}] Failed to warm up stream: {e!r}")
+            await stream.destroy()
+            return
+        self.warm.append(stream)
+
+    def get(self, key):
+        stream = self.streams.get(key)
+        if stream is not None:
+            stream.touch()
+        return stream
+
+    async def close(self, key):
+        stream = self.streams.pop(key, None)
+        if stream is not None:
+            await stream.destroy()
+
+    # Close streams that have been idle too long or whose connection failed, replace pooled
+    # streams that failed or got too old, and top the pool back up
+    async def sweep(self):
+        now = time.monotonic()
+        for key, stream in list(self.streams.items()):
+            if stream.connecting:
+                continue
+            if not stream.alive or now - stream.last_active > self.idle_timeout:
+                print(f"[{key}] Closing {'idle' if stream.alive else stream.connection_state} stream")
+                await self.close(key)
+        for stream in list(self.warm):
+            if not self._healthy(stream):
+                print(f"[{stream.key}] Replacing pooled stream ({stream.connection_state}, {stream.age:.0f}s old)")
+                self.warm.remove(stream)
+                await stream.destroy()
+        self._refill()
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
             try:
-                while True:
-                    frame = await track.recv()
-                    # Convert frame to numpy array
-                    img = frame.to_ndarray(format="bgr24")
-                    # Display using OpenCV
-                    cv2.imshow("Video Frame", img)
-                    if cv2.waitKey(1) & 0xFF == ord('q'):
-                        break
+                await self.sweep()
             except Exception as e:
-                print(f"Error receiving frame: {e}")
-            finally:
-                await recorder.stop()
+                print(f"Stream sweep failed: {e}")
 
-    @pc_data_channel.on('message')
-    def on_message(message):
-        print(f"Data channel message received: {message}")
-
-    print('Created peer connection')
-
-    try:
-        await peer_connection.setRemoteDescription(offer)
-        print('Set remote SDP')
-    except Exception as e:
-        print('Failed to set remote SDP:', e)
-        raise e
-
-    try:
-        answer = await peer_connection.createAnswer()
-        print('Created local SDP')
-        await peer_connection.setLocalDescription(answer)
-        print('Set local SDP')
-    except Exception as e:
-        print('Error creating or setting local SDP:', e)
-        raise e
-
-    return answer
-
-async def stop_all_streams():
-    global stream_video_opacity
-    if peer_connection:
-        print('Stopping video streams')
-        stream_video_opacity = 0
-
-async def close_pc():
-    global peer_connection
-    if peer_connection:
-        print('Closing peer connection')
-        await peer_connection.close()
-        peer_connection = None
+    def start(self):
+        if self._reaper is None:
+            self._reaper = asyncio.get_running_loop().create_task(self._reap())
+        self._refill()
 
+    async def stop(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+        for task in self._warming:
+            task.cancel()
+        await asyncio.gather(*self._warming, return_exceptions=True)
+        warm, self.warm = list(self.warm), deque()
+        await asyncio.gather(
+            *(self.close(key) for key in list(self.streams)), *(stream.destroy() for stream in warm),
+            return_exceptions=True,
+        )
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self):
+        states = {}
+        for stream in self.streams.values():
+            states[stream.connection_state] = states.get(stream.connection_state, 0) + 1
+        return {
+            "streams": len(self.streams),
+            "max_streams": self.max_streams,
+            "states": states,
+            "pool": {"size": self.pool_size, "warm": len(self.warm), "warming": len(self._warming)},
+        }
+
+# python d_id_stream.py [number of streams]
 async def main():
-    await connect()
+    # Only when run as a script, so importing this module leaves the host's logging alone
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+    metrics_runner = await serve_metrics(METRICS_PORT) if METRICS_PORT else None
+    manager = StreamManager(on_video=show_video)
+    manager.start()
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    results = await asyncio.gather(*(manager.open() for _ in range(count)), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Failed to open stream: {result}")
     await asyncio.sleep(300)  # Keep running for some time to allow viewing frames
-    await destroy()
+    await manager.stop()
+    await close_http_clients()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
 
 if __name__ == "__main__":
     asyncio.run(main())
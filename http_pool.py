@@ -0,0 +1,60 @@
+import os
+import aiohttp
+import httpx
+
+# HTTP/2 needs the optional h2 package (pip install httpx[http2]); fall back to HTTP/1.1 keep-alive without it
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Connection pool limits shared by every outgoing request in the process
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 30))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "1") == "1" and HTTP2_AVAILABLE
+
+_httpx_client = None
+_aiohttp_session = None
+
+
+# Process-wide httpx client, created on first use
+def get_httpx_client():
+    global _httpx_client
+    if _httpx_client is None or _httpx_client.is_closed:
+        _httpx_client = httpx.AsyncClient(
+            http2=HTTP2_ENABLED,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=HTTP_TIMEOUT,
+        )
+    return _httpx_client
+
+
+# Process-wide aiohttp session, created on first use (must be called from the running loop)
+def get_aiohttp_session():
+    global _aiohttp_session
+    if _aiohttp_session is None or _aiohttp_session.closed:
+        _aiohttp_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=HTTP_MAX_CONNECTIONS,
+                keepalive_timeout=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+        )
+    return _aiohttp_session
+
+
+async def close_http_clients():
+    global _httpx_client, _aiohttp_session
+    if _httpx_client is not None:
+        await _httpx_client.aclose()
+        _httpx_client = None
+    if _aiohttp_session is not None:
+        await _aiohttp_session.close()
+        _aiohttp_session = None
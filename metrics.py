@@ -0,0 +1,236 @@
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+
+# Minimal Prometheus instrumentation: counters, gauges and histograms rendered in the text
+# exposition format, without pulling in a client library. Only touched from the event loop.
+
+# Seconds; spans sub-millisecond encodes up to multi-second WebRTC setup
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        if not self.labelnames:
+            self.children[()] = self._new_child()
+        registry.register(self)
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self.children.get(key)
+        if child is None:
+            child = self.children[key] = self._new_child()
+        return child
+
+    def _only(self):
+        return self.children[()]
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._only().inc(amount)
+
+    def samples(self):
+        for key, child in self.children.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    # Read the value from fn() at scrape time instead
+    def set_function(self, fn):
+        self.function = fn
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._only().set(value)
+
+    def inc(self, amount=1):
+        self._only().inc(amount)
+
+    def dec(self, amount=1):
+        self._only().dec(amount)
+
+    def set_function(self, fn):
+        self._only().set_function(fn)
+
+    def samples(self):
+        for key, child in self.children.items():
+            try:
+                value = child.get()
+            except Exception as e:
+                logging.warning(f"Gauge {self.name} failed to read: {e!r}")
+                continue
+            if value is not None:
+                yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._only().observe(value)
+
+    def time(self):
+        return self._only().time()
+
+    def samples(self):
+        for key, child in self.children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts + [child.count - sum(child.counts)]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {child.count}"
+
+
+# Time spent in each stage of the audio and signaling paths: decode, chunk, encode, disk_write,
+# did_post, chunk_fetch, first_chunk, sdp, sdp_post, ice_post, connected
+STAGE_SECONDS = Histogram("avatar_stage_seconds", "Time spent per pipeline stage", ["stage"])
+
+
+def stage(name):
+    return STAGE_SECONDS.labels(stage=name)
+
+
+# Fraction of hot-path events that are logged (warnings and errors always are)
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.01))
+
+
+# Structured, sampled logging for hot paths: one "event key=value ..." line, formatted only when
+# the event is actually emitted
+class SampledLogger:
+    def __init__(self, name, rate=None):
+        self.logger = logging.getLogger(name)
+        self.rate = LOG_SAMPLE_RATE if rate is None else rate
+
+    def event(self, event, level=logging.INFO, **fields):
+        if level < logging.WARNING and (self.rate <= 0 or random.random() >= self.rate):
+            return
+        if not self.logger.isEnabledFor(level):
+            return
+        self.logger.log(level, "%s %s", event, " ".join(f"{key}={value}" for key, value in fields.items()))
+
+
+# Serve REGISTRY on http://<host>:<port>/metrics from a standalone script (app.py has its own route)
+async def serve_metrics(port, host="127.0.0.1"):
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+
+# Decides when to send each chunk so it reaches the avatar service just before the previous one finishes.
+# The playback timeline is modelled from chunk durations: chunk k+1 is sent `lead_time` plus the
+# measured round-trip time before chunk k is expected to end. The first chunk goes out immediately.
+class PacingScheduler:
+    def __init__(self, lead_time=1.0, initial_rtt=0.3, rtt_alpha=0.25):
+        self.lead_time = lead_time
+        self.rtt = initial_rtt
+        self.rtt_alpha = rtt_alpha
+        # Expected time (monotonic) at which everything sent so far has finished playing
+        self.play_until = None
+        # Chunks that were expected to start after the previous one had already ended
+        self.underruns = 0
+
+    # Wait until the next chunk should be sent, then account for its duration (seconds)
+    async def wait_turn(self, duration):
+        now = time.monotonic()
+        if self.play_until is not None:
+            send_at = self.play_until - self.lead_time - self.rtt
+            if send_at > now:
+                await asyncio.sleep(send_at - now)
+                now = time.monotonic()
+
+        arrives_at = now + self.rtt
+        if self.play_until is None:
+            starts_at = arrives_at
+        else:
+            starts_at = max(self.play_until, arrives_at)
+            if arrives_at > self.play_until:
+                self.underruns += 1
+        self.play_until = starts_at + duration
+
+    # Feed back the latency of a completed POST (exponentially weighted)
+    def record_rtt(self, seconds):
+        self.rtt += self.rtt_alpha * (seconds - self.rtt)
+
+    def stats(self):
+        return {
+            "lead_time": self.lead_time,
+            "rtt": round(self.rtt, 4),
+            "underruns": self.underruns,
+        }
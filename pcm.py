@@ -0,0 +1,140 @@
+import subprocess
+import wave
+import numpy as np
+
+# Raw audio is signed 16-bit little-endian, interleaved channels. In memory it is an int16 array of
+# shape (frames, channels); slicing one gives a view onto the same buffer, never a copy.
+SAMPLE_WIDTH = 2
+DTYPE = np.dtype("<i2")
+
+
+# View raw PCM (bytes-like or an array) as (frames, channels) without copying
+def as_frames(pcm, channels):
+    if isinstance(pcm, np.ndarray):
+        return pcm.reshape(-1, channels)
+    usable = len(pcm) // (SAMPLE_WIDTH * channels) * SAMPLE_WIDTH * channels
+    return np.frombuffer(pcm, dtype=DTYPE, count=usable // SAMPLE_WIDTH).reshape(-1, channels)
+
+
+# Sample rate and channel count of a file's first audio stream
+def probe(path):
+    proc = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=sample_rate,channels",
+         "-of", "csv=p=0", path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+    )
+    if proc.returncode != 0 or not proc.stdout.strip():
+        raise RuntimeError(f"ffprobe failed on {path}: {proc.stderr.strip()}")
+    sample_rate, channels = proc.stdout.strip().splitlines()[0].split(",")[:2]
+    return int(sample_rate), int(channels)
+
+
+# Append-only PCM store backed by one array. Views handed out stay valid: when the buffer has to
+# grow (or drop consumed frames) it moves to a new array and the old one lives on as long as its views.
+class PcmBuffer:
+    def __init__(self, sample_rate, channels, capacity=0, data=None):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.data = data if data is not None else np.empty((capacity, channels), dtype=DTYPE)
+        # Live frames are data[start:end]
+        self.start = 0
+        self.end = len(self.data) if data is not None else 0
+
+    # Decode a whole file with ffmpeg into a single buffer, at the file's own rate and channel count
+    # unless given
+    @classmethod
+    def from_file(cls, path, sample_rate=None, channels=None):
+        if sample_rate is None or channels is None:
+            source_rate, source_channels = probe(path)
+            sample_rate, channels = sample_rate or source_rate, channels or source_channels
+        proc = subprocess.run(
+            ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", path,
+             "-f", "s16le", "-acodec", "pcm_s16le", "-ac", str(channels), "-ar", str(sample_rate), "pipe:1"],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to decode {path}: {proc.stderr.decode(errors='replace').strip()}")
+        return cls(sample_rate, channels, data=as_frames(proc.stdout, channels))
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def duration(self):
+        return len(self) / self.sample_rate
+
+    def append(self, pcm):
+        frames = as_frames(pcm, self.channels)
+        if self.end + len(frames) > len(self.data) or not self.data.flags.writeable:
+            self._reallocate(len(frames))
+        self.data[self.end:self.end + len(frames)] = frames
+        self.end += len(frames)
+
+    def _reallocate(self, extra):
+        live = len(self)
+        data = np.empty((max(2 * (live + extra), 4096), self.channels), dtype=DTYPE)
+        data[:live] = self.data[self.start:self.end]
+        self.data, self.start, self.end = data, 0, live
+
+    # Frames [start, end) of the live audio, as a view
+    def view(self, start=0, end=None):
+        end = len(self) if end is None else min(end, len(self))
+        return self.data[self.start + start:self.start + end]
+
+    # Hand out the first `count` live frames as a view and drop them from the buffer
+    def consume(self, count):
+        frames = self.view(0, count)
+        self.start += len(frames)
+        return frames
+
+
+# Linear-interpolation resampling of (frames, channels) int16 audio, vectorized over all samples
+def resample(frames, from_rate, to_rate):
+    if from_rate == to_rate or len(frames) == 0:
+        return frames
+    count = int(len(frames) * to_rate / from_rate)
+    positions = np.arange(count, dtype=np.float64) * (from_rate / to_rate)
+    index = np.minimum(positions.astype(np.int64), len(frames) - 1)
+    following = np.minimum(index + 1, len(frames) - 1)
+    weight = (positions - index)[:, None].astype(np.float32)
+    mixed = frames[index] * (1 - weight) + frames[following] * weight
+    return np.rint(mixed).astype(DTYPE)
+
+
+# Downmix to mono by averaging, or upmix mono by duplicating
+def convert_channels(frames, channels):
+    if frames.shape[1] == channels:
+        return frames
+    if channels == 1:
+        return np.rint(frames.mean(axis=1, keepdims=True)).astype(DTYPE)
+    if frames.shape[1] == 1:
+        return np.repeat(frames, channels, axis=1)
+    raise ValueError(f"Cannot convert {frames.shape[1]} channels to {channels}")
+
+
+def _contiguous(frames):
+    return memoryview(np.ascontiguousarray(frames)).cast("B")
+
+
+# Encode (frames, channels) audio with ffmpeg, piping the samples straight from the array.
+# Writes to `path` if given, otherwise returns the encoded bytes.
+def encode(frames, sample_rate, format="mp3", path=None):
+    channels = frames.shape[1]
+    proc = subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+         "-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels), "-i", "pipe:0",
+         "-f", format, path or "pipe:1"],
+        input=_contiguous(frames), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to encode {format}: {proc.stderr.decode(errors='replace').strip()}")
+    return path if path else proc.stdout
+
+
+# Write (frames, channels) audio as a WAV file without going through an encoder
+def write_wav(path, frames, sample_rate):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(frames.shape[1])
+        f.setsampwidth(SAMPLE_WIDTH)
+        f.setframerate(sample_rate)
+        f.writeframes(_contiguous(frames))
@@ -0,0 +1,173 @@
+import asyncio
+import time
+from collections import deque
+
+
+class Batch:
+    def __init__(self, event, group, items, single=False):
+        self.event = event
+        self.group = group
+        self.items = items
+        # A message queued with send(): emitted as-is and never merged with other batches
+        self.single = single
+        self.created = time.monotonic()
+
+
+# Outbound Socket.IO stage. Items added with add() are grouped per (event, group) and flushed as one
+# batch when the time window ends or the batch is full. Batches wait in a bounded queue; when it is
+# full the oldest batch is dropped ("drop-oldest") or the new batch is merged into the newest queued
+# batch for the same (event, group) ("coalesce"). A single sender emits batches in order, owns the
+# connection (reconnecting with backoff), and only removes a batch once its emit succeeded, so
+# batches queued while disconnected are replayed after reconnecting.
+class BatchingEmitter:
+    def __init__(self, sio, url, socketio_path="socket.io", window=0.05, max_batch=64, max_queue=256,
+                 policy="drop-oldest", payload=None, reconnect_delay=0.5, max_reconnect_delay=10.0):
+        if policy not in ("drop-oldest", "coalesce"):
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.sio = sio
+        self.url = url
+        self.socketio_path = socketio_path
+        self.window = window
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.policy = policy
+        # payload(event, group, items) -> emitted data; defaults to {"group": ..., "items": [...]}
+        self.payload = payload or (lambda event, group, items: {"group": group, "items": items})
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.pending = {}
+        self.flush_timers = {}
+        self.queue = deque()
+        self.in_flight = None
+        self.ready = asyncio.Event()
+        self.sender = None
+        self.batches_sent = 0
+        self.items_sent = 0
+        self.dropped_batches = 0
+        self.dropped_items = 0
+        self.coalesced = 0
+        self.reconnects = 0
+        self.latencies = deque(maxlen=1000)
+
+    def start(self):
+        if self.sender is None:
+            self.sender = asyncio.ensure_future(self._send_loop())
+
+    # Add one item to the open batch for (event, group); never blocks
+    def add(self, event, item, group=None):
+        key = (event, group)
+        batch = self.pending.get(key)
+        if batch is None:
+            batch = self.pending[key] = Batch(event, group, [])
+            self.flush_timers[key] = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+        batch.items.append(item)
+        if len(batch.items) >= self.max_batch:
+            self._flush(key)
+
+    # Queue a message on its own, after any items already added for the same group
+    def send(self, event, data, group=None):
+        for key in [key for key in self.pending if key[1] == group]:
+            self._flush(key)
+        self._enqueue(Batch(event, group, [data], single=True))
+
+    def _flush(self, key):
+        timer = self.flush_timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self.pending.pop(key, None)
+        if batch is not None:
+            self._enqueue(batch)
+
+    def flush_all(self):
+        for key in list(self.pending):
+            self._flush(key)
+
+    def _enqueue(self, batch):
+        if len(self.queue) >= self.max_queue:
+            if self.policy == "coalesce" and not batch.single:
+                for queued in reversed(self.queue):
+                    if (queued.event, queued.group) == (batch.event, batch.group) and not queued.single:
+                        queued.items.extend(batch.items)
+                        self.coalesced += 1
+                        return
+            oldest = self.queue.popleft()
+            self.dropped_batches += 1
+            self.dropped_items += len(oldest.items)
+        self.queue.append(batch)
+        self.ready.set()
+
+    async def _connect(self):
+        delay = self.reconnect_delay
+        while not self.sio.connected:
+            try:
+                await self.sio.connect(self.url, socketio_path=self.socketio_path)
+                print(f"Connected to the Socket.IO server at {self.url}")
+            except Exception as e:
+                print(f"Failed to connect to the Socket.IO server: {e}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _send_loop(self):
+        connected_once = False
+        while True:
+            if not self.queue:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+            if not self.sio.connected:
+                if connected_once:
+                    self.reconnects += 1
+                await self._connect()
+                connected_once = True
+            batch = self.in_flight = self.queue.popleft()
+            data = batch.items[0] if batch.single else self.payload(batch.event, batch.group, batch.items)
+            start = time.monotonic()
+            try:
+                await self.sio.emit(batch.event, data)
+            except Exception as e:
+                # Back to the front of the queue: replayed first once the connection is back
+                print(f"Emit of {batch.event} failed: {e}, will replay after reconnecting")
+                self.queue.appendleft(batch)
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+            finally:
+                self.in_flight = None
+            now = time.monotonic()
+            # Emit time, and time from the batch's creation to the emit completing
+            self.latencies.append((now - start, now - batch.created))
+            self.batches_sent += 1
+            self.items_sent += len(batch.items)
+
+    # Flush open batches and wait (up to `timeout` seconds) for the queue to drain
+    async def close(self, timeout=10.0):
+        self.flush_all()
+        deadline = time.monotonic() + timeout
+        while (self.queue or self.in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        if self.sender is not None:
+            self.sender.cancel()
+            await asyncio.gather(self.sender, return_exceptions=True)
+            self.sender = None
+        if self.sio.connected:
+            await self.sio.disconnect()
+
+    def stats(self):
+        emit = sorted(latency for latency, _ in self.latencies)
+        total = sorted(latency for _, latency in self.latencies)
+
+        def percentile(values, p):
+            return round(values[min(int(len(values) * p), len(values) - 1)] * 1000, 2) if values else None
+
+        return {
+            "queued": len(self.queue),
+            "batches_sent": self.batches_sent,
+            "items_sent": self.items_sent,
+            "dropped_batches": self.dropped_batches,
+            "dropped_items": self.dropped_items,
+            "coalesced": self.coalesced,
+            "reconnects": self.reconnects,
+            "emit_ms_p50": percentile(emit, 0.5),
+            "emit_ms_p95": percentile(emit, 0.95),
+            "batch_age_ms_p50": percentile(total, 0.5),
+            "batch_age_ms_p95": percentile(total, 0.95),
+        }
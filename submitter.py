@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import random
+import httpx
+
+# Responses worth retrying: rate limiting and server-side failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# POST with retries on transport errors and retryable statuses, sleeping a random ("full jitter")
+# fraction of an exponentially growing delay between attempts. Returns the last response,
+# or raises the last transport error if no attempt got one.
+async def post_with_retries(client, url, retries=3, backoff=0.25, max_backoff=4.0, **kwargs):
+    for attempt in range(retries + 1):
+        try:
+            response = await client.post(url, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+            logging.warning(f"POST {url} returned {response.status_code}, retrying (attempt {attempt + 2})")
+        except httpx.TransportError as e:
+            if attempt == retries:
+                raise
+            logging.warning(f"POST {url} failed: {e!r}, retrying (attempt {attempt + 2})")
+        await asyncio.sleep(random.uniform(0, min(max_backoff, backoff * 2 ** attempt)))
+
+
+# Run the coroutines produced by `jobs` (an async iterable) concurrently, at most max_in_flight
+# at a time, and yield their results in the order the jobs were produced. A slow job only holds
+# back delivery of later results, not their execution. Producing jobs pauses once max_in_flight
+# finished-but-undelivered results are waiting.
+async def ordered_pipeline(jobs, max_in_flight):
+    slots = asyncio.Semaphore(max_in_flight)
+    started = asyncio.Queue(max_in_flight)
+
+    async def run(job):
+        async with slots:
+            return await job
+
+    async def feed():
+        try:
+            async for job in jobs:
+                await started.put(asyncio.ensure_future(run(job)))
+        except Exception as e:
+            await started.put(e)
+        await started.put(None)
+
+    feeder = asyncio.ensure_future(feed())
+    try:
+        while True:
+            item = await started.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield await item
+    finally:
+        feeder.cancel()
+        await asyncio.gather(feeder, return_exceptions=True)
+        while not started.empty():
+            item = started.get_nowait()
+            if isinstance(item, asyncio.Future):
+                item.cancel()
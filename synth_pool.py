@@ -0,0 +1,344 @@
+import asyncio
+import enum
+import json
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import SimpleNamespace
+from tts_cache import TtsResult
+
+# The Azure SDK is only needed for the "azure" backend
+try:
+    import azure.cognitiveservices.speech as speechsdk
+except ImportError:
+    speechsdk = None
+
+
+# Collects the events of one synthesis. The pool points a synthesizer's callbacks at the
+# Synthesis it is currently running, so a reused synthesizer never mixes requests.
+class Synthesis:
+    def __init__(self, text, ssml=False, on_viseme=None, on_audio=None):
+        self.text = text
+        self.ssml = ssml
+        self.visemes = []
+        self.blend_shapes = []
+        self.audio = b""
+        self.reason = None
+        self.completed = False
+        # Optional callback(offset_ms, viseme_id, animation), called on the SDK's event thread
+        self.on_viseme = on_viseme
+        # Optional callback(audio_bytes) for each chunk of audio as the SDK produces it
+        self.on_audio = on_audio
+
+    def handle_viseme(self, evt):
+        offset = evt.audio_offset / 10000
+        self.visemes.append([offset, evt.viseme_id])
+        animation = None
+        if evt.animation:
+            try:
+                animation = json.loads(evt.animation) if isinstance(evt.animation, str) else evt.animation
+                self.blend_shapes.append(animation)
+            except ValueError as e:
+                print(f"Error parsing animation data: {e}")
+        if self.on_viseme is not None:
+            self.on_viseme(offset, evt.viseme_id, animation)
+
+    def handle_audio(self, evt):
+        if self.on_audio is not None and evt.result.audio_data:
+            self.on_audio(evt.result.audio_data)
+
+    def to_result(self):
+        return TtsResult(self.audio, self.visemes, self.blend_shapes)
+
+
+# A synthesizer with its callbacks connected once, routing events to the current Synthesis
+class PooledSynthesizer:
+    def __init__(self, synthesizer):
+        self.synthesizer = synthesizer
+        self.current = None
+        self.uses = 0
+        synthesizer.viseme_received.connect(self._on_viseme)
+        synthesizer.synthesizing.connect(self._on_audio)
+
+    def _on_viseme(self, evt):
+        current = self.current
+        if current is not None:
+            current.handle_viseme(evt)
+
+    def _on_audio(self, evt):
+        current = self.current
+        if current is not None:
+            current.handle_audio(evt)
+
+    def run(self, synthesis):
+        self.current = synthesis
+        self.uses += 1
+        try:
+            if synthesis.ssml:
+                result = self.synthesizer.speak_ssml_async(synthesis.text).get()
+            else:
+                result = self.synthesizer.speak_text_async(synthesis.text).get()
+        finally:
+            self.current = None
+        synthesis.reason = result.reason
+        synthesis.completed = getattr(result.reason, "name", None) == "SynthesizingAudioCompleted"
+        if synthesis.completed:
+            synthesis.audio = result.audio_data
+        return synthesis
+
+
+# Fixed set of warm synthesizers handed out one request at a time. Safe to use from any thread.
+# Async callers run on the pool's own threads, one per synthesizer, so requests waiting for a free
+# synthesizer queue up without holding threads of the event loop's default executor.
+class SynthesizerPool:
+    def __init__(self, factory, size):
+        self.size = size
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="synthesizer")
+        self.queued = 0
+        self.waits = 0
+        self.completed = 0
+        self.failed = 0
+        for _ in range(size):
+            self._idle.put(PooledSynthesizer(factory()))
+
+    # Blocking: run one synthesis on the next free synthesizer
+    def synthesize(self, text, ssml=False, on_viseme=None, on_audio=None):
+        synthesis = Synthesis(text, ssml, on_viseme, on_audio)
+        try:
+            pooled = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.waits += 1
+            pooled = self._idle.get()
+        try:
+            pooled.run(synthesis)
+        finally:
+            self._idle.put(pooled)
+            # An exception from the SDK counts as a failure too
+            with self._lock:
+                if synthesis.completed:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+        return synthesis
+
+    # Run a synthesis on one of the pool's threads without blocking the event loop
+    async def asynthesize(self, text, ssml=False, on_viseme=None, on_audio=None):
+        return await self._submit(self.synthesize, text, ssml, on_viseme, on_audio)
+
+    # Run fn on the pool's threads, counting it as queued until a thread picks it up
+    def _submit(self, fn, *args):
+        with self._lock:
+            # Every idle synthesizer is already spoken for by an earlier request
+            if self._idle.qsize() <= self.queued:
+                self.waits += 1
+            self.queued += 1
+
+        def call():
+            with self._lock:
+                self.queued -= 1
+            return fn(*args)
+
+        return asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    # Yield a synthesis' events the moment the SDK raises them: ("viseme", [offset_ms, viseme_id]),
+    # ("blend_shapes", animation), ("audio", bytes), and finally ("done", synthesis).
+    # SDK callbacks run on its own threads; they hand events to the loop with call_soon_threadsafe.
+    async def stream(self, text, ssml=False):
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+
+        def push(event):
+            try:
+                loop.call_soon_threadsafe(events.put_nowait, event)
+            except RuntimeError:
+                pass  # loop already closed, nobody is listening
+
+        def on_viseme(offset, viseme_id, animation):
+            push(("viseme", [offset, viseme_id]))
+            if animation is not None:
+                push(("blend_shapes", animation))
+
+        def run():
+            try:
+                push(("done", self.synthesize(text, ssml, on_viseme, lambda data: push(("audio", data)))))
+            except Exception as e:
+                push(("error", e))
+
+        self._submit(run)
+        while True:
+            kind, value = await events.get()
+            if kind == "error":
+                raise value
+            yield kind, value
+            if kind == "done":
+                return
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            # Async requests waiting for a synthesizer
+            "queued": self.queued,
+            # Requests that found no free synthesizer when they arrived
+            "waits": self.waits,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+# The events of an already finished (e.g. cached) result, in the same shape as SynthesizerPool.stream
+def result_events(result):
+    for viseme in result.visemes:
+        yield "viseme", viseme
+    for animation in result.blend_shapes:
+        yield "blend_shapes", animation
+    if result.audio:
+        yield "audio", result.audio
+
+
+# Raw mono 16-bit PCM output formats of the Speech SDK, by sample rate
+RAW_PCM_FORMATS = {
+    8000: "Raw8Khz16BitMonoPcm",
+    16000: "Raw16Khz16BitMonoPcm",
+    22050: "Raw22050Hz16BitMonoPcm",
+    24000: "Raw24Khz16BitMonoPcm",
+    44100: "Raw44100Hz16BitMonoPcm",
+    48000: "Raw48Khz16BitMonoPcm",
+}
+
+
+# Factory for Azure synthesizers with the service connection opened ahead of the first request.
+# With pcm_sample_rate, audio comes back as raw mono s16le PCM at that rate instead of the default format.
+def azure_factory(key, region, voice=None, pcm_sample_rate=None):
+    if speechsdk is None:
+        raise RuntimeError("azure-cognitiveservices-speech is not installed")
+    if pcm_sample_rate is not None and pcm_sample_rate not in RAW_PCM_FORMATS:
+        raise ValueError(f"No raw PCM output format at {pcm_sample_rate} Hz")
+
+    def create():
+        speech_config = speechsdk.SpeechConfig(subscription=key, region=region)
+        if voice:
+            speech_config.speech_synthesis_voice_name = voice
+        if pcm_sample_rate is not None:
+            speech_config.set_speech_synthesis_output_format(
+                getattr(speechsdk.SpeechSynthesisOutputFormat, RAW_PCM_FORMATS[pcm_sample_rate])
+            )
+        synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+        speechsdk.Connection.from_speech_synthesizer(synthesizer).open(True)
+        return synthesizer
+
+    return create
+
+
+class FakeResultReason(enum.Enum):
+    SynthesizingAudioCompleted = 1
+    Canceled = 2
+
+
+class FakeSignal:
+    def __init__(self):
+        self._callbacks = []
+
+    def connect(self, callback):
+        self._callbacks.append(callback)
+
+    def disconnect_all(self):
+        self._callbacks.clear()
+
+    def fire(self, evt):
+        for callback in list(self._callbacks):
+            callback(evt)
+
+
+# Offline stand-in for SpeechSynthesizer: same calls and events, with configurable latency.
+# Raises viseme events from its own thread, as the SDK does, then completes with silent audio.
+class FakeSynthesizer:
+    def __init__(self, latency=0.05, per_char=0.002, failure_rate=0.0, sample_rate=16000):
+        self.latency = latency
+        self.per_char = per_char
+        self.failure_rate = failure_rate
+        self.sample_rate = sample_rate
+        self.viseme_received = FakeSignal()
+        self.synthesizing = FakeSignal()
+
+    def speak_text_async(self, text):
+        return self._start(text, blend_shapes=False)
+
+    def speak_ssml_async(self, ssml):
+        return self._start(ssml, blend_shapes="FacialExpression" in ssml)
+
+    def _start(self, text, blend_shapes):
+        future = Future()
+        threading.Thread(target=self._run, args=(text, blend_shapes, future), daemon=True).start()
+        return SimpleNamespace(get=future.result)
+
+    def _run(self, text, blend_shapes, future):
+        words = text.split()
+        duration = max(len(words), 1) * 0.3
+        audio = bytes(int(duration * self.sample_rate) * 2)
+        steps = max(len(words) * 2, 1)
+        pause = (self.latency + self.per_char * len(text)) / steps
+        for i in range(steps):
+            time.sleep(pause)
+            offset = i * duration / steps
+            animation = None
+            if blend_shapes:
+                frames = [[random.random() for _ in range(55)] for _ in range(int(duration / steps * 60) or 1)]
+                animation = json.dumps({"FrameIndex": int(offset * 60), "BlendShapes": frames})
+            self.viseme_received.fire(SimpleNamespace(
+                audio_offset=int(offset * 10_000_000), viseme_id=random.randint(0, 21), animation=animation,
+            ))
+            start = len(audio) * i // steps
+            chunk = audio[start:len(audio) * (i + 1) // steps]
+            self.synthesizing.fire(SimpleNamespace(result=SimpleNamespace(audio_data=chunk)))
+        if random.random() < self.failure_rate:
+            future.set_result(SimpleNamespace(reason=FakeResultReason.Canceled, audio_data=b""))
+        else:
+            future.set_result(SimpleNamespace(reason=FakeResultReason.SynthesizingAudioCompleted, audio_data=audio))
+
+
+# Synthesizer factory for `backend` ("azure" or "fake"), by default the one named by SPEECH_BACKEND
+def synthesizer_factory(key, region, voice=None, backend=None, pcm_sample_rate=None):
+    backend = backend or os.getenv("SPEECH_BACKEND", "azure")
+    if backend == "fake":
+        latency = float(os.getenv("FAKE_SPEECH_LATENCY", 0.05))
+        return lambda: FakeSynthesizer(latency=latency, sample_rate=pcm_sample_rate or 16000)
+    return azure_factory(key, region, voice, pcm_sample_rate)
+
+
+# Offline load test: python synth_pool.py [pool size] [requests] [concurrency]
+async def load_test(size, requests, concurrency):
+    pool = SynthesizerPool(lambda: FakeSynthesizer(), size)
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with gate:
+            start = time.perf_counter()
+            synthesis = await pool.asynthesize(f"Hello, how are you? This is request number {i}.")
+            latencies.append(time.perf_counter() - start)
+            assert synthesis.completed and synthesis.visemes
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"{requests} syntheses in {elapsed:.2f}s ({requests / elapsed:.1f}/s) with {size} synthesizers")
+    print(f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms")
+    print(pool.stats())
+
+
+if __name__ == "__main__":
+    import sys
+    args = [int(a) for a in sys.argv[1:4]]
+    size, requests, concurrency = args + [4, 200, 16][len(args):]
+    asyncio.run(load_test(size, requests, concurrency))
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+
+# On-disk record layout (little-endian):
+#   header:     magic, audio length, viseme count, animation chunk count
+#   audio:      raw bytes as returned by the synthesizer
+#   visemes:    (offset in ms as float64, viseme id as uint16) per viseme
+#   animation:  per chunk: frame index (uint32), frame count (uint32), blend shapes per frame (uint16),
+#               then frame count * blend shapes float32 values
+MAGIC = b"TTS1"
+HEADER = struct.Struct("<4sIII")
+VISEME = struct.Struct("<dH")
+ANIMATION = struct.Struct("<IIH")
+
+
+class TtsResult:
+    def __init__(self, audio, visemes, blend_shapes=None):
+        self.audio = audio
+        # [[offset_ms, viseme_id], ...] as produced by the viseme_received callbacks
+        self.visemes = visemes
+        # Parsed evt.animation payloads: [{"FrameIndex": n, "BlendShapes": [[float, ...], ...]}, ...]
+        self.blend_shapes = blend_shapes or []
+
+
+def encode_result(result):
+    parts = [HEADER.pack(MAGIC, len(result.audio), len(result.visemes), len(result.blend_shapes)), result.audio]
+    parts.extend(VISEME.pack(offset, viseme_id) for offset, viseme_id in result.visemes)
+    for animation in result.blend_shapes:
+        frames = animation["BlendShapes"]
+        width = len(frames[0]) if frames else 0
+        parts.append(ANIMATION.pack(animation["FrameIndex"], len(frames), width))
+        parts.append(array("f", (value for frame in frames for value in frame)).tobytes())
+    return b"".join(parts)
+
+
+def decode_result(data):
+    magic, audio_len, viseme_count, animation_count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a TTS cache record")
+    pos = HEADER.size
+    audio = data[pos:pos + audio_len]
+    pos += audio_len
+    visemes = []
+    for _ in range(viseme_count):
+        offset, viseme_id = VISEME.unpack_from(data, pos)
+        visemes.append([offset, viseme_id])
+        pos += VISEME.size
+    blend_shapes = []
+    for _ in range(animation_count):
+        frame_index, frame_count, width = ANIMATION.unpack_from(data, pos)
+        pos += ANIMATION.size
+        values = array("f")
+        values.frombytes(data[pos:pos + frame_count * width * 4])
+        pos += frame_count * width * 4
+        frames = [values[i * width:(i + 1) * width].tolist() for i in range(frame_count)]
+        blend_shapes.append({"FrameIndex": frame_index, "BlendShapes": frames})
+    return TtsResult(audio, visemes, blend_shapes)
+
+
+# Synthesis results keyed by (input, voice, output format): one file per result under `root`,
+# fronted by a least-recently-used memory tier bounded in bytes. Safe to use from worker threads.
+class TtsCache:
+    def __init__(self, root, max_memory_bytes=64 * 1024 * 1024):
+        self.root = root
+        self.max_memory_bytes = max_memory_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(text, voice="", output_format="default", ssml=False):
+        kind = "ssml" if ssml else "text"
+        return hashlib.sha256(f"{kind}\0{voice}\0{output_format}\0{text}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.tts")
+
+    def get(self, key):
+        with self._lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            result = decode_result(data)
+        except (OSError, ValueError, struct.error):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, result, len(data))
+        return result
+
+    def put(self, key, result):
+        data = encode_result(result)
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._remember(key, result, len(data))
+
+    def _remember(self, key, result, size):
+        if size > self.max_memory_bytes:
+            return
+        previous = self.memory.pop(key, None)
+        if previous is not None:
+            self.memory_bytes -= previous[1]
+        self.memory[key] = (result, size)
+        self.memory_bytes += size
+        while self.memory_bytes > self.max_memory_bytes:
+            _, (_, evicted_size) = self.memory.popitem(last=False)
+            self.memory_bytes -= evicted_size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_entries": len(self.memory),
+                "memory_bytes": self.memory_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,69 @@
+import hashlib
+import logging
+import re
+from audio_stream import encode_chunks
+from chunk_policy import SilenceChunker
+from metrics import stage
+from pcm import as_frames, convert_channels, resample
+from submitter import ordered_pipeline
+
+# Sentence boundaries: terminal punctuation (optionally followed by closing quotes/brackets) and whitespace
+SENTENCE_END = re.compile(r"(?<=[.!?。！？])[\"')\]]*\s+")
+
+
+# Split a script into sentences, dropping empty ones
+def split_sentences(script):
+    return [sentence.strip() for sentence in SENTENCE_END.split(script) if sentence.strip()]
+
+
+# Identifies a script's audio for the chunk cache, together with the voice and backend that speak it
+def script_digest(script, voice="", backend=""):
+    return hashlib.sha256(f"tts\0{backend}\0{voice}\0{script}".encode()).hexdigest()
+
+
+# Synthesize the sentences of `script` on `pool` (a synth_pool.SynthesizerPool producing raw PCM),
+# up to `parallel` at a time, and yield each sentence's PCM in script order as soon as it and
+# every sentence before it are done
+async def synthesize_sentences(pool, script, parallel):
+    sentences = split_sentences(script)
+
+    async def jobs():
+        for i, sentence in enumerate(sentences):
+            yield synthesize(i, sentence)
+
+    async def synthesize(i, sentence):
+        synthesis = await pool.asynthesize(sentence)
+        if not synthesis.completed:
+            raise RuntimeError(f"Speech synthesis of sentence {i + 1}/{len(sentences)} failed: {synthesis.reason}")
+        logging.debug(f"Synthesized sentence {i + 1}/{len(sentences)}: {len(synthesis.audio)} bytes")
+        return synthesis.audio
+
+    async for pcm in ordered_pipeline(jobs(), parallel):
+        yield pcm
+
+
+# Cut each sentence's PCM into chunks following `policy`, with chunk sizes growing across the
+# whole script. A sentence's last chunk is sent short rather than waiting for the next sentence,
+# so audio never waits on later synthesis. Mono PCM synthesized at source_rate is converted to
+# sample_rate and `channels` first.
+async def sentence_blocks(sentences_pcm, policy, sample_rate, channels, source_rate=None):
+    chunker = SilenceChunker(policy, sample_rate, channels)
+    chunk_time = stage("chunk")
+    async for pcm in sentences_pcm:
+        with chunk_time.time():
+            frames = convert_channels(resample(as_frames(pcm, 1), source_rate or sample_rate, sample_rate), channels)
+            chunks = chunker.feed(frames) + chunker.flush()
+        for chunk in chunks:
+            yield chunk
+
+
+# Chunk producer for ChunkCache.chunks: synthesize `script` sentence by sentence and encode its
+# audio into dest_dir (or memory) as each sentence finishes
+def tts_chunks(pool, script, dest_dir, policy, sample_rate, channels, format="mp3", parallel=4,
+               encode_pool=None, ahead=2, in_memory=False, source_rate=None):
+    blocks = sentence_blocks(
+        synthesize_sentences(pool, script, parallel), policy, sample_rate, channels, source_rate=source_rate,
+    )
+    return encode_chunks(
+        blocks, dest_dir, sample_rate, channels, format, pool=encode_pool, ahead=ahead, in_memory=in_memory,
+    )
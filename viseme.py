@@ -1,51 +1,93 @@
 import os
-from azure.cognitiveservices.speech import SpeechConfig, SpeechSynthesizer, SpeechSynthesisResult, ResultReason
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from tts_cache import TtsCache
+from synth_pool import SynthesizerPool, result_events, synthesizer_factory
+from viseme_stream import sse_event
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Synthesizer dibuat dan dihubungkan saat startup, bukan per request
+    global synthesizer_pool
+    synthesizer_pool = SynthesizerPool(synthesizer_factory(SPEECH_KEY, SPEECH_REGION, SPEECH_VOICE), SYNTHESIZER_POOL_SIZE)
+    yield
+    synthesizer_pool.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 # Konfigurasi Azure Speech SDK
 SPEECH_KEY = os.getenv("SPEECH_KEY")
 SPEECH_REGION = os.getenv("SPEECH_REGION")
+# Voice kosong berarti suara default SDK
+SPEECH_VOICE = os.getenv("SPEECH_VOICE", "")
 
-@app.get("/get")
-async def get_speech(text: str = "I'm excited to try text to speech"):
-    try:
-        # Mengatur konfigurasi speech
-        speech_config = SpeechConfig(subscription=SPEECH_KEY, region=SPEECH_REGION)
-        # speech_config.speech_synthesis_voice_name = f"ja-JP-{teacher}Neural"
+# Jumlah synthesizer yang disiapkan (SPEECH_BACKEND=fake untuk uji beban offline)
+SYNTHESIZER_POOL_SIZE = int(os.getenv("SYNTHESIZER_POOL_SIZE", 4))
+synthesizer_pool = None
 
-        # Mengatur speech synthesizer
-        synthesizer = SpeechSynthesizer(speech_config=speech_config, audio_config=None)
-        visemes = []
+# Cache hasil sintesis (audio + visemes) untuk teks yang sama
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", 64 * 1024 * 1024))
+tts_cache = TtsCache(TTS_CACHE_DIR, TTS_CACHE_MEMORY_BYTES)
 
-        def viseme_callback(evt):
-            print(f"Viseme received: {evt.viseme_id} at offset {evt.audio_offset / 10000}")
-            visemes.append([evt.audio_offset / 10000, evt.viseme_id])
+def speech_response(audio_data, visemes):
+    # Mengatur header respons untuk data audio
+    response = Response(content=audio_data, media_type="audio/mpeg")
+    response.headers["Content-Disposition"] = "inline; filename=tts.mp3"
+    response.headers["Visemes"] = str(visemes)
+    return response
 
-        synthesizer.viseme_received.connect(viseme_callback)
+@app.get("/get")
+async def get_speech(text: str = "I'm excited to try text to speech"):
+    try:
+        # Teks yang sudah pernah disintesis langsung dijawab dari cache
+        cache_key = tts_cache.key(text, SPEECH_VOICE)
+        cached = tts_cache.get(cache_key)
+        if cached is not None:
+            return speech_response(cached.audio, cached.visemes)
 
-        # Melakukan speech synthesis
-        result: SpeechSynthesisResult = synthesizer.speak_text_async(text).get()
+        # Melakukan speech synthesis dengan synthesizer dari pool, tanpa memblokir event loop
+        synthesis = await synthesizer_pool.asynthesize(text)
 
         # Memeriksa alasan hasil sintesis
-        if result.reason == ResultReason.SynthesizingAudioCompleted:
-            # Mengambil data audio dari hasil
-            audio_data = result.audio_data
-
-            # Mengatur header respons untuk data audio
-            response = Response(content=audio_data, media_type="audio/mpeg")
-            response.headers["Content-Disposition"] = "inline; filename=tts.mp3"
-            response.headers["Visemes"] = str(visemes)
-
-            return response
+        if synthesis.completed:
+            tts_cache.put(cache_key, synthesis.to_result())
+            return speech_response(synthesis.audio, synthesis.visemes)
         else:
-            raise HTTPException(status_code=500, detail=f"Speech synthesis failed with reason: {result.reason}")
+            raise HTTPException(status_code=500, detail=f"Speech synthesis failed with reason: {synthesis.reason}")
 
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Mode inkremental: setiap viseme dan potongan audio dikirim lewat SSE saat SDK memunculkannya,
+# sehingga lip-sync bisa dimulai sejak frame audio pertama
+@app.get("/stream")
+async def stream_speech(text: str = "I'm excited to try text to speech"):
+    cache_key = tts_cache.key(text, SPEECH_VOICE)
+    cached = tts_cache.get(cache_key)
+
+    async def event_generator():
+        # Hasil dari cache diputar ulang sebagai event yang sama
+        if cached is not None:
+            for kind, value in result_events(cached):
+                yield sse_event(kind, value)
+            yield sse_event("done", {"text": text})
+            return
+
+        async for kind, value in synthesizer_pool.stream(text):
+            if kind != "done":
+                yield sse_event(kind, value)
+            elif value.completed:
+                tts_cache.put(cache_key, value.to_result())
+                yield sse_event("done", {"text": text})
+            else:
+                print(f"Speech synthesis failed with reason: {value.reason}")
+                yield sse_event("error", {"text": text, "reason": str(value.reason)})
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="localhost", port=8000, log_level="debug")
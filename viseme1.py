@@ -1,11 +1,22 @@
 import asyncio
 import os
 import json
-from azure.cognitiveservices.speech import SpeechConfig, SpeechSynthesizer, SpeechSynthesisResult, ResultReason
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.responses import StreamingResponse
+from tts_cache import TtsCache
+from synth_pool import SynthesizerPool, result_events, synthesizer_factory
+from viseme_stream import sse_event
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Synthesizers are created and connected once at startup, then reused by every request
+    global synthesizer_pool
+    synthesizer_pool = SynthesizerPool(synthesizer_factory(SPEECH_KEY, SPEECH_REGION), SYNTHESIS_WORKERS)
+    yield
+    synthesizer_pool.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 # Azure Speech SDK configuration
 SPEECH_KEY = os.getenv("SPEECH_KEY")
@@ -20,39 +31,92 @@ texts = [
     "That's great! Keep up the good work."
 ]
 
-@app.get("/stream-visemes")
-async def stream_visemes():
-    try:
-        # Configure speech
-        speech_config = SpeechConfig(subscription=SPEECH_KEY, region=SPEECH_REGION)
+# Synthesis results (audio + visemes) reused for repeated texts
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", 64 * 1024 * 1024))
+tts_cache = TtsCache(TTS_CACHE_DIR, TTS_CACHE_MEMORY_BYTES)
+
+# Number of warm synthesizers, i.e. texts synthesized concurrently (SPEECH_BACKEND=fake for offline testing)
+SYNTHESIS_WORKERS = int(os.getenv("SYNTHESIS_WORKERS", 4))
+synthesizer_pool = None
+
+# Synthesize one text (or find it in the cache) and return its visemes
+async def synthesize_visemes(text):
+    cache_key = tts_cache.key(text)
+    cached = tts_cache.get(cache_key)
+    if cached is not None:
+        return True, None, cached.visemes
+
+    synthesis = await synthesizer_pool.asynthesize(text)
+    if synthesis.completed:
+        tts_cache.put(cache_key, synthesis.to_result())
+    return synthesis.completed, synthesis.reason, synthesis.visemes
 
-        # Set up the speech synthesizer
-        synthesizer = SpeechSynthesizer(speech_config=speech_config, audio_config=None)
-        visemes = []
+# Collect one text's events into `events` as they arrive (replayed from the cache when possible),
+# ending with a ("done", ...) or ("error", ...) event
+async def pump_events(text, events):
+    cache_key = tts_cache.key(text)
+    cached = tts_cache.get(cache_key)
+    if cached is not None:
+        for event in result_events(cached):
+            events.put_nowait(event)
+        events.put_nowait(("done", {"text": text}))
+        return
 
-        def viseme_callback(evt):
-            visemes.append([evt.audio_offset / 10000, evt.viseme_id])
+    try:
+        async for kind, value in synthesizer_pool.stream(text):
+            if kind != "done":
+                events.put_nowait((kind, value))
+            elif value.completed:
+                tts_cache.put(cache_key, value.to_result())
+                events.put_nowait(("done", {"text": text}))
+            else:
+                events.put_nowait(("error", {"text": text, "reason": str(value.reason)}))
+    except Exception as e:
+        events.put_nowait(("error", {"text": text, "reason": str(e)}))
+
+@app.get("/stream-visemes")
+async def stream_visemes(incremental: bool = False):
+    if incremental:
+        # Texts are synthesized concurrently but streamed in order: the current text's events go out
+        # the moment the SDK raises them, later texts buffer until their turn
+        async def event_generator():
+            queues = [asyncio.Queue() for _ in texts]
+            pumps = [asyncio.ensure_future(pump_events(text, events)) for text, events in zip(texts, queues)]
+            try:
+                for events in queues:
+                    while True:
+                        kind, value = await events.get()
+                        yield sse_event(kind, value)
+                        if kind in ("done", "error"):
+                            break
+            finally:
+                for pump in pumps:
+                    pump.cancel()
 
-        synthesizer.viseme_received.connect(viseme_callback)
+        return StreamingResponse(event_generator(), media_type="text/event-stream")
 
+    try:
         # Generate visemes from text
         async def viseme_generator():
-            for text in texts:
-                result: SpeechSynthesisResult = synthesizer.speak_text_async(text).get()
-
-                if result.reason == ResultReason.SynthesizingAudioCompleted:
-                    # Send the visemes received
-                    response_data = {
-                        "text": text,
-                        "visemes": visemes
-                    }
-                    yield json.dumps(response_data) + '\n\n'
-                    visemes.clear()  # Clear visemes for the next text
-                else:
-                    raise HTTPException(status_code=500, detail=f"Speech synthesis failed with reason: {result.reason}")
-                
-                # Delay between texts (if needed)
-                await asyncio.sleep(5)  # Adjust delay as needed
+            # Start every text at once; the pool runs SYNTHESIS_WORKERS of them at a time
+            jobs = [asyncio.ensure_future(synthesize_visemes(text)) for text in texts]
+            try:
+                # Send each text's visemes, in order, as soon as its synthesis is done
+                for text, job in zip(texts, jobs):
+                    completed, reason, visemes = await job
+
+                    if completed:
+                        response_data = {
+                            "text": text,
+                            "visemes": visemes
+                        }
+                        yield json.dumps(response_data) + '\n\n'
+                    else:
+                        raise HTTPException(status_code=500, detail=f"Speech synthesis failed with reason: {reason}")
+            finally:
+                for job in jobs:
+                    job.cancel()
 
         # Create streaming response
         response = StreamingResponse(viseme_generator(), media_type="text/event-stream")
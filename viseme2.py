@@ -1,15 +1,44 @@
 import asyncio
 import os
 import json
-from azure.cognitiveservices.speech import SpeechConfig, SpeechSynthesizer, SpeechSynthesisResult, ResultReason
 import socketio
+from tts_cache import TtsCache
+from synth_pool import SynthesizerPool, result_events, synthesizer_factory
+from blend_codec import encode_frames, stack_animations
+from sio_emitter import BatchingEmitter
 
 # Azure Speech SDK configuration
 SPEECH_KEY = os.getenv("SPEECH_KEY")
 SPEECH_REGION = os.getenv("SPEECH_REGION")
 
-# Socket.IO client setup
-sio = socketio.AsyncClient()
+# Synthesis results (audio, visemes, blend shapes) reused for repeated SSML
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", 64 * 1024 * 1024))
+tts_cache = TtsCache(TTS_CACHE_DIR, TTS_CACHE_MEMORY_BYTES)
+
+# Blend shapes are sent as binary frame batches (see blend_codec.py: float32, int16, delta-int16,
+# delta-float32), or as the SDK's JSON with "json"
+BLEND_SHAPE_ENCODING = os.getenv("BLEND_SHAPE_ENCODING", "int16")
+
+# Socket.IO client setup; reconnection is handled by the emitter so queued batches are replayed
+SOCKET_URL = os.getenv("SOCKET_URL", "http://localhost:3000")
+SOCKET_PATH = os.getenv("SOCKET_PATH", "/api/socket")
+sio = socketio.AsyncClient(reconnection=False)
+
+# Emitter batching: events are grouped per text for EMIT_WINDOW_MS or up to EMIT_MAX_BATCH items,
+# at most EMIT_MAX_QUEUE batches wait for a slow server (EMIT_POLICY: drop-oldest or coalesce)
+EMIT_WINDOW_MS = float(os.getenv("EMIT_WINDOW_MS", 50))
+EMIT_MAX_BATCH = int(os.getenv("EMIT_MAX_BATCH", 64))
+EMIT_MAX_QUEUE = int(os.getenv("EMIT_MAX_QUEUE", 256))
+EMIT_POLICY = os.getenv("EMIT_POLICY", "drop-oldest")
+
+# Repeat every viseme and blend-shape frame of a text in its trailing 'message', for clients that
+# only read that event. Off by default: the frames have already been streamed, and the message
+# then only marks the end of the text.
+EMIT_FULL_MESSAGE = os.getenv("EMIT_FULL_MESSAGE", "0").lower() in ("1", "true", "yes")
+
+# Delay between texts in seconds (if needed)
+TEXT_DELAY = float(os.getenv("TEXT_DELAY", 0))
 
 # Texts to be synthesized
 texts = [
@@ -17,42 +46,26 @@ texts = [
     "I am fine, thank you."
 ]
 
-# Function to connect to the Socket.IO server
-async def connect_socket():
-    try:
-        await sio.connect('http://localhost:3000', socketio_path='/api/socket')
-        print('Connected to the Socket.IO server')
-    except Exception as e:
-        print(f"Failed to connect to the Socket.IO server: {e}")
+# Payload of one batch of events for a text. Audio goes out as a binary attachment, blend shapes
+# as one binary frame batch, visemes as JSON.
+def batch_payload(kind, text, items):
+    if kind == "audio":
+        return {"text": text, "audio": b"".join(items)}
+    if kind == "blend_shapes":
+        if BLEND_SHAPE_ENCODING == "json":
+            return {"text": text, "3d_blend_shapes": items}
+        return {"text": text, "3d_blend_shapes": encode_frames(*stack_animations(items), encoding=BLEND_SHAPE_ENCODING)}
+    return {"text": text, "visemes": items}
+
+emitter = BatchingEmitter(
+    sio, SOCKET_URL, socketio_path=SOCKET_PATH, window=EMIT_WINDOW_MS / 1000, max_batch=EMIT_MAX_BATCH,
+    max_queue=EMIT_MAX_QUEUE, policy=EMIT_POLICY, payload=batch_payload,
+)
 
 # Function to handle visemes and synthesize speech
 async def synthesize_speech():
     try:
-        # Configure speech
-        speech_config = SpeechConfig(subscription=SPEECH_KEY, region=SPEECH_REGION)
-
-        # Set up the speech synthesizer
-        synthesizer = SpeechSynthesizer(speech_config=speech_config, audio_config=None)
-        visemes = []
-        blend_shapes_3d = []
-
-        def viseme_callback(evt):
-            visemes.append([evt.audio_offset / 10000, evt.viseme_id])
-            if evt.animation:
-                try:
-                    # Check if evt.animation is a string and parse it if needed
-                    if isinstance(evt.animation, str):
-                        animation_data = json.loads(evt.animation)  # Parse JSON string into dictionary
-                    elif isinstance(evt.animation, dict):
-                        animation_data = evt.animation  # Already a dictionary
-                    else:
-                        raise ValueError("Unexpected type for evt.animation")
-                    
-                    blend_shapes_3d.append(animation_data)
-                except (json.JSONDecodeError, ValueError) as e:
-                    print(f"Error parsing animation data: {e}")
-
-        synthesizer.viseme_received.connect(viseme_callback)
+        synthesizer_pool = SynthesizerPool(synthesizer_factory(SPEECH_KEY, SPEECH_REGION), 1)
 
         # Generate visemes from text
         for text in texts:
@@ -65,41 +78,56 @@ async def synthesize_speech():
             </speak>
             """
 
-            result: SpeechSynthesisResult = synthesizer.speak_ssml_async(ssml).get()
-
-            if result.reason == ResultReason.SynthesizingAudioCompleted:
-                # Prepare the visemes data
-                response_data = {
-                    "text": text,
-                    "visemes": visemes,
-                    "3d_blend_shapes": blend_shapes_3d
-                }
-
-                # Emit the visemes data to the Socket.IO server
-                await sio.emit('message', json.dumps(response_data))
-
-                visemes.clear()  # Clear visemes for the next text
-                blend_shapes_3d.clear()  # Clear blend shapes for the next text
+            # Repeated SSML is answered from the cache without calling Azure
+            cache_key = tts_cache.key(ssml, ssml=True)
+            cached = tts_cache.get(cache_key)
+            if cached is not None:
+                for kind, value in result_events(cached):
+                    emitter.add(kind, value, group=text)
             else:
-                print(f"Speech synthesis failed with reason: {result.reason}")
+                # Stream every viseme, blend-shape frame and audio chunk as the SDK raises it
+                async for kind, value in synthesizer_pool.stream(ssml, ssml=True):
+                    if kind != "done":
+                        emitter.add(kind, value, group=text)
+                    elif value.completed:
+                        cached = value.to_result()
+                        tts_cache.put(cache_key, cached)
+                    else:
+                        print(f"Speech synthesis failed with reason: {value.reason}")
 
-            # Delay between texts (if needed)
-            await asyncio.sleep(5)  # Adjust delay as needed
+            if cached is not None:
+                # Prepare the visemes data
+                response_data = {"text": text}
+                if EMIT_FULL_MESSAGE:
+                    response_data["visemes"] = cached.visemes
+                    response_data["3d_blend_shapes"] = cached.blend_shapes
+
+                if BLEND_SHAPE_ENCODING == "json":
+                    # Emit the end of the text (with the complete visemes data if enabled) once it is done
+                    emitter.send('message', json.dumps(response_data), group=text)
+                else:
+                    if EMIT_FULL_MESSAGE:
+                        # All frames of the text in one batch, sent as a binary attachment
+                        response_data["3d_blend_shapes"] = encode_frames(*stack_animations(cached.blend_shapes), encoding=BLEND_SHAPE_ENCODING)
+                    emitter.send('message', response_data, group=text)
+
+            if TEXT_DELAY:
+                await asyncio.sleep(TEXT_DELAY)
 
     except Exception as e:
         print(f"Error: {e}")
 
 # Main entry point
 async def main():
-    # Connect to the Socket.IO server
-    await connect_socket()
-    
+    # The emitter connects to the Socket.IO server and keeps the connection up
+    emitter.start()
+
     # Run the speech synthesis
     await synthesize_speech()
 
-    # Disconnect from the server
-    await asyncio.sleep(5)  # Wait for the last message to be sent
-    await sio.disconnect()
+    # Wait for queued batches to be sent, then disconnect
+    await emitter.close()
+    print(f"Emitter stats: {emitter.stats()}")
 
 if __name__ == "__main__":
     asyncio.run(main())
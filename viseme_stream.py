@@ -0,0 +1,17 @@
+import base64
+import json
+
+# Server-Sent Events framing for the (kind, value) events of SynthesizerPool.stream / result_events.
+# Audio is base64 encoded; visemes and blend shapes are sent as JSON.
+
+
+def event_data(kind, value):
+    if kind == "audio":
+        return {"audio": base64.b64encode(value).decode("ascii")}
+    if kind == "viseme":
+        return {"offset": value[0], "viseme_id": value[1]}
+    return value
+
+
+def sse_event(kind, value):
+    return f"event: {kind}\ndata: {json.dumps(event_data(kind, value))}\n\n"
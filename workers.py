@@ -0,0 +1,72 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Runs in the worker process: time the call so utilization reflects actual CPU-bound work
+def _timed_call(fn, args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+# Process pool for blocking audio work, with a bounded number of submitted jobs.
+# Callers past the bound wait in run(), which pushes backpressure up to the stream producing the work.
+# `timings` (e.g. a metrics histogram) observes each job's time in the worker.
+class WorkerPool:
+    def __init__(self, max_workers, max_pending, timings=None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timings = timings
+        self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        self._slots = asyncio.Semaphore(max_pending)
+        self.submitted = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.started = time.monotonic()
+
+    async def run(self, fn, *args):
+        self.waiting += 1
+        queued_at = time.perf_counter()
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.wait_seconds += time.perf_counter() - queued_at
+
+        self.submitted += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result, elapsed = await loop.run_in_executor(self._executor, _timed_call, fn, args)
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.submitted -= 1
+            self._slots.release()
+        self.completed += 1
+        self.busy_seconds += elapsed
+        if self.timings is not None:
+            self.timings.observe(elapsed)
+        return result
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        uptime = time.monotonic() - self.started
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "in_flight": self.submitted,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "wait_seconds": round(self.wait_seconds, 3),
+            # Share of total worker time spent running jobs since startup
+            "utilization": round(self.busy_seconds / (uptime * self.max_workers), 4) if uptime else 0.0,
+        }